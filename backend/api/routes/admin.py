@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from pydantic import BaseModel
+from backend.core.security import require_admin
+from backend.services.response_cache import response_cache
+from backend.services.sahdevvv import sd
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+class CacheInvalidationRequest(BaseModel):
+    prefix: Optional[str] = None
+    persona: Optional[str] = None
+    generation: Optional[str] = None
+
+class QueryCacheInvalidationRequest(BaseModel):
+    tables: List[str] = []
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    return response_cache.stats()
+
+@router.post("/cache/invalidate")
+async def invalidate_cache(req: CacheInvalidationRequest):
+    """
+    Removes cached AI responses whose normalized question starts with `prefix`, for the given
+    persona and/or training data generation. With an empty body the whole response cache is cleared.
+    """
+    removed = response_cache.invalidate(prefix=req.prefix, persona=req.persona, generation=req.generation)
+    return {"removed": removed}
+
+@router.get("/sql-templates/stats")
+async def get_sql_template_stats():
+    """
+    How often generated SQL came straight from a trained question (exact or template match).
+    """
+    return sd.sql_templates.stats()
+
+def _query_cache():
+    if sd.query_cache is None:
+        raise HTTPException(status_code=404, detail="Query result cache is disabled")
+    return sd.query_cache
+
+@router.get("/query-cache/stats")
+async def get_query_cache_stats():
+    return _query_cache().stats()
+
+@router.post("/query-cache/invalidate")
+async def invalidate_query_cache(req: QueryCacheInvalidationRequest):
+    """
+    Marks cached query results that read any of `tables` as stale; call it after those tables
+    are reloaded. With no tables the whole query result cache is cleared.
+    """
+    cache = _query_cache()
+    if not req.tables:
+        return {"removed": cache.clear()}
+    return {"versions": cache.invalidate_tables(req.tables)}
@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response
-from typing import List
-from backend.models.chat import ChatMessage, ChatResponse, ChatSession, GetPersonaRequest
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from backend.models.chat import ChatMessage, ChatResponse, ChatSession, ChatSessionSummary, GetPersonaRequest
 from backend.services.chat import ChatService
+from backend.services.custom_json import TableDataSerializer
 from backend.core.security import get_current_user, create_access_token, get_user_for_token_endpoint
 from backend.core.config import settings
 
 from pydantic import BaseModel
 from typing import List, Dict, Any
 import logging
+import json
 from datetime import timedelta
 
 router = APIRouter()
@@ -63,6 +66,22 @@ async def create_session(req: GetPersonaRequest, current_user: dict = Depends(ge
 async def get_sessions(current_user: dict = Depends(get_current_user)):
     return await chat_service.get_user_sessions(str(current_user["id"]))
 
+@router.get("/sessions/summaries", response_model=List[ChatSessionSummary])
+async def get_session_summaries(
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Lists the user's sessions, newest first, without their messages. When more sessions
+    exist, the X-Next-Cursor header holds the `cursor` value of the next page.
+    """
+    sessions, next_cursor = await chat_service.list_user_sessions(str(current_user["id"]), limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return sessions
+
 @router.post("/{session_id}/send", response_model=ChatResponse)
 async def send_message(
     session_id: str,
@@ -71,6 +90,29 @@ async def send_message(
 ):
     return await chat_service.process_message(message.text, session_id, current_user)
 
+@router.post("/{session_id}/send/stream")
+async def send_message_stream(
+    session_id: str,
+    message: ChatMessage,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Server-sent events variant of /send. Emits `sql`, then `rows` pages, then `summary`
+    tokens, then `next_question`, and finally `message` with the saved ChatResponse
+    (or `text` instead of sql/rows/summary when the answer is plain text).
+    """
+    events = await chat_service.stream_message(message.text, session_id, current_user)
+
+    async def event_stream():
+        async for event, data in events:
+            yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/{session_id}/messages", response_model=List[ChatMessage])
 async def get_session_messages(
     session_id: str,
@@ -78,6 +120,42 @@ async def get_session_messages(
 ):
     return await chat_service.get_session_messages(session_id, str(current_user["id"]))
 
+@router.get("/{session_id}/messages/{message_id}/table")
+async def get_message_table(
+    session_id: str,
+    message_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(200, ge=1, le=5000),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Returns one page of the result table of a message, in the layout the message was stored
+    with, plus `offset`, `row_count` and `truncated`.
+    """
+    page = await chat_service.get_message_table(session_id, message_id, str(current_user["id"]), offset, limit)
+    page["offset"] = offset
+    return page
+
+@router.get("/{session_id}/messages/{message_id}/table.arrow")
+async def get_message_table_arrow(
+    session_id: str,
+    message_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Returns the result table of a message as an Arrow IPC stream.
+    """
+    table_data = await chat_service.get_message_table(session_id, message_id, str(current_user["id"]))
+    try:
+        body = TableDataSerializer.to_arrow_ipc(TableDataSerializer.to_dataframe(table_data))
+    except ImportError as e:
+        logging.error(str(e))
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Arrow output is not available on this server"
+        )
+    return Response(content=body, media_type="application/vnd.apache.arrow.stream")
+
 @router.delete("/sessions/{session_id}", status_code=204)
 async def delete_session(
     session_id: str,
@@ -6,6 +6,7 @@ from fastapi.security import OAuth2PasswordBearer
 from backend.core.config import settings
 from backend.database.mongodb import MongoDB
 import urllib
+import secrets
 
 # Using the tokenUrl parameter even though we'll handle token generation differently
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token", auto_error=False)
@@ -91,4 +92,15 @@ async def get_user_for_token_endpoint(uniqueKey: str = Query(...)):
     Dedicated authentication method for the token endpoint only.
     This function specifically only accepts a uniqueKey parameter.
     """
-    return await get_current_user_from_uniqueKey(uniqueKey)
\ No newline at end of file
+    return await get_current_user_from_uniqueKey(uniqueKey)
+
+async def require_admin(x_admin_key: Optional[str] = Header(None)):
+    """
+    Guards the admin endpoints with the shared ADMIN_API_KEY (sent as the X-Admin-Key header).
+    The endpoints are disabled when no key is configured.
+    """
+    if not settings.ADMIN_API_KEY or not secrets.compare_digest(x_admin_key or "", settings.ADMIN_API_KEY):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access denied",
+        )
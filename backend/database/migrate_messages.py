@@ -0,0 +1,81 @@
+"""
+Moves chat messages out of the embedded `messages` array of each `chats` document and
+into the `chat_messages` collection, and rewrites session timestamps stored as BSON dates
+as ISO strings (the type new sessions use), so session listing sorts on one type.
+
+Usage: python -m backend.database.migrate_messages [--dry-run]
+
+The app also runs `migrate_sessions` at startup, so sessions written by an older version are
+migrated before they are served. Safe to re-run, also from several workers at once: messages
+are upserted on (session_id, id), and a session's `messages` array is only removed (and its
+`message_count` raised by its length) once all of its messages have been written, by whichever run gets there first.
+"""
+import sys
+import asyncio
+import logging
+
+import pytz
+from pymongo import UpdateOne
+
+from backend.database.mongodb import MongoDB
+
+SESSIONS_COLLECTION = "chats"
+MESSAGES_COLLECTION = "chat_messages"
+
+
+def _to_local_iso(timestamp) -> str:
+    # BSON dates come back naive in UTC; new sessions store Asia/Kolkata ISO strings
+    return pytz.utc.localize(timestamp).astimezone(pytz.timezone("Asia/Kolkata")).isoformat()
+
+
+async def migrate_sessions(dry_run: bool = False, verbose: bool = True) -> int:
+    """Migrate every session that still has an embedded `messages` array; returns how many there were"""
+    sessions = await MongoDB.get_collection(SESSIONS_COLLECTION)
+    messages = await MongoDB.get_collection(MESSAGES_COLLECTION)
+
+    migrated_sessions = 0
+    migrated_messages = 0
+    cursor = sessions.find({"messages": {"$exists": True}}, {"id": 1, "user_id": 1, "messages": 1})
+    async for session in cursor:
+        session_messages = session.get("messages") or []
+        operations = []
+        for message in session_messages:
+            message = {**message, "session_id": session["id"], "user_id": session["user_id"]}
+            operations.append(
+                UpdateOne({"session_id": session["id"], "id": message.get("id")}, {"$setOnInsert": message}, upsert=True)
+            )
+
+        if verbose:
+            print(f"Session {session['id']}: {len(operations)} messages")
+        if not dry_run:
+            if operations:
+                await messages.bulk_write(operations, ordered=True)
+            await sessions.update_one(
+                {"_id": session["_id"], "messages": {"$exists": True}},
+                # $inc keeps messages saved meanwhile by a worker that is already serving
+                {"$unset": {"messages": ""}, "$inc": {"message_count": len(session_messages)}}
+            )
+        migrated_sessions += 1
+        migrated_messages += len(operations)
+
+    print(f"{'Would migrate' if dry_run else 'Migrated'} {migrated_messages} messages from {migrated_sessions} sessions")
+
+    normalized = 0
+    async for session in sessions.find({"timestamp": {"$type": "date"}}, {"timestamp": 1}):
+        if not dry_run:
+            await sessions.update_one({"_id": session["_id"]}, {"$set": {"timestamp": _to_local_iso(session["timestamp"])}})
+        normalized += 1
+    print(f"{'Would normalize' if dry_run else 'Normalized'} {normalized} session timestamps")
+    return migrated_sessions
+
+
+async def migrate(dry_run: bool = False) -> None:
+    await MongoDB.connect_db()
+    await MongoDB.ensure_indexes()
+    await migrate_sessions(dry_run=dry_run)
+    await MongoDB.close_db()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(migrate(dry_run="--dry-run" in sys.argv[1:]))
@@ -1,4 +1,5 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING
 from backend.core.config import settings
 import logging
 import os
@@ -14,6 +15,19 @@ class MongoDB:
     client: Optional[AsyncIOMotorClient] = None
     db = None
 
+    # Indexes created at startup, per collection: (keys, options)
+    INDEXES = {
+        "chats": [
+            ([("id", ASCENDING)], {}),
+            ([("user_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], {}),
+        ],
+        "chat_messages": [
+            ([("session_id", ASCENDING), ("timestamp", ASCENDING)], {}),
+            ([("user_id", ASCENDING), ("session_id", ASCENDING)], {}),
+            ([("id", ASCENDING)], {}),
+        ],
+    }
+
     @classmethod
     async def connect_db(cls) -> None:
         """Connect to MongoDB/Cosmos DB"""
@@ -96,6 +110,17 @@ class MongoDB:
        # print(f"Connected to {collection_name}")
         return cls.db[collection_name]
 
+    @classmethod
+    async def ensure_indexes(cls) -> None:
+        """Create the indexes in INDEXES (a no-op for indexes that already exist)"""
+        for collection_name, indexes in cls.INDEXES.items():
+            collection = await cls.get_collection(collection_name)
+            for keys, options in indexes:
+                try:
+                    await collection.create_index(keys, **options)
+                except Exception as e:
+                    logging.warning(f"Could not create index {keys} on {collection_name}: {e}")
+
     @classmethod
     def is_connected(cls) -> bool:
         """Check if connected to database"""
@@ -4,30 +4,53 @@ from backend.core.config import settings
 import logging
 import os
 from typing import Optional, AsyncGenerator
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import asyncpg
+
+
+def _sslmode(connection_string: str) -> str:
+    # The URL's sslmode wins over the POSTGRES_SSLMODE setting; asyncpg takes the libpq names as `ssl`
+    return dict(parse_qsl(urlsplit(connection_string).query)).get("sslmode") or settings.POSTGRES_SSLMODE
+
+
+def _without_sslmode(connection_string: str) -> str:
+    # asyncpg.connect() has no `sslmode` keyword; SQLAlchemy would pass it through from the URL
+    parts = urlsplit(connection_string)
+    query = [(key, value) for key, value in parse_qsl(parts.query) if key != "sslmode"]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+async def _init_connection(conn) -> None:
+    from pgvector.asyncpg import register_vector
+
+    # pgvector `vector` values travel in binary as numpy arrays
+    await register_vector(conn)
 
 class PostgresDB:
     engine: Optional[AsyncEngine] = None
     async_session: Optional[async_sessionmaker[AsyncSession]] = None
+    # Plain asyncpg pool for hot-path queries; asyncpg prepares and caches each statement per connection
+    pool: Optional[asyncpg.Pool] = None
 
     @classmethod
     async def connect_db(cls) -> None:
         """Connect to PostgreSQL database"""
         try:
+            # Modify connection string to use asyncpg
+            connection_string = os.getenv('POSTGRES_URL', settings.POSTGRES_URL)
+            if not connection_string:
+                raise ValueError("PostgreSQL connection string not provided")
+
+            # Ensure the connection string uses asyncpg driver
+            if not connection_string.startswith('postgresql+asyncpg://'):
+                connection_string = connection_string.replace('postgresql://', 'postgresql+asyncpg://')
+            # SSL is requested through connect_args / ssl below
+            sslmode = _sslmode(connection_string)
+            connection_string = _without_sslmode(connection_string)
+
             if cls.engine is None:
                 logging.info("Connecting to PostgreSQL...")
-                
-                # Modify connection string to use asyncpg
-                connection_string = os.getenv('POSTGRES_URL', settings.POSTGRES_URL)
-                
-                # Ensure the connection string uses asyncpg driver
-                if not connection_string.startswith('postgresql+asyncpg://'):
-                    connection_string = connection_string.replace('postgresql://', 'postgresql+asyncpg://')
-                
-                if not connection_string:
-                    raise ValueError("PostgreSQL connection string not provided")
-
-                logging.info(f"Connecting to {connection_string}")
-                print(f"Connecting to {connection_string}  posttgres")
 
                 # Create async engine with additional SSL parameters for Azure Cosmos
                 cls.engine = create_async_engine(
@@ -39,7 +62,7 @@ class PostgresDB:
                     pool_recycle=1800,  # 30 minutes
                     pool_pre_ping=True,
                     connect_args={
-                        "ssl": True,
+                        "ssl": sslmode,
                         "server_settings": {
                             "application_name": "YourAppName"
                         }
@@ -53,17 +76,30 @@ class PostgresDB:
                     class_=AsyncSession
                 )
 
-                logging.info("Successfully connected to PostgreSQL")
+            if cls.pool is None:
+                cls.pool = await asyncpg.create_pool(
+                    connection_string.replace('postgresql+asyncpg://', 'postgresql://'),
+                    min_size=settings.POSTGRES_POOL_MIN_SIZE,
+                    max_size=settings.POSTGRES_POOL_MAX_SIZE,
+                    max_inactive_connection_lifetime=1800,
+                    ssl=sslmode,
+                    init=_init_connection,
+                )
+
+            logging.info("Successfully connected to PostgreSQL")
 
         except Exception as e:
             logging.error(f"PostgreSQL connection error: {str(e)}")
-            if cls.engine:
+            if cls.engine or cls.pool:
                 await cls.close_db()
             raise
 
     @classmethod
     async def close_db(cls) -> None:
         """Close PostgreSQL connection"""
+        if cls.pool:
+            await cls.pool.close()
+            cls.pool = None
         if cls.engine:
             await cls.engine.dispose()
             cls.engine = None
@@ -87,6 +123,11 @@ class PostgresDB:
         """Check if connected to database"""
         return cls.engine is not None and cls.async_session is not None
 
+    @classmethod
+    def get_pool(cls) -> Optional[asyncpg.Pool]:
+        """The shared asyncpg pool, or None before connect_db()"""
+        return cls.pool
+
     @classmethod
     async def ping(cls) -> bool:
         """Test database connection"""
@@ -5,12 +5,15 @@ from fastapi.staticfiles import StaticFiles
 # from fastapi_cache.backends.inmemory import InMemoryBackend
 # from fastapi_cache.decorator import cache
 from fastapi.responses import FileResponse, JSONResponse
-from backend.api.routes import chat
+from backend.api.routes import chat, admin
 from backend.core.config import settings
 import uvicorn
 from contextlib import asynccontextmanager
 from backend.database.mongodb import MongoDB
-#from backend.database.postgres import PostgresDB
+from backend.database.migrate_messages import migrate_sessions
+from backend.services.table_store import table_store
+from backend.database.postgres import PostgresDB
+from backend.services.prompt_next_question import PromptQuestion
 #from backend.database.redis import RedisClient
 import logging
 import os
@@ -50,17 +53,34 @@ async def lifespan(app: FastAPI):
         logger.info("Connecting to Mongo DB")
         await MongoDB.connect_db()
         logger.info("Successfully connected to Mongo")
+        await MongoDB.ensure_indexes()
+        # Sessions saved before messages moved to their own collection have no message_count
+        await migrate_sessions(verbose=False)
+        try:
+            await table_store.ensure_indexes()
+        except Exception as e:
+            logger.warning(f"Could not create result table indexes: {e}")
         logger.info("Connecting to Postgres")
         print("Connecting to Postgres")
-        #await PostgresDB.connect_db()
-        # print("Successfully connected to Postgres")
-        # logger.info("Successfully connected to Postgres")
+        try:
+            await PostgresDB.connect_db()
+            try:
+                await PromptQuestion.ensure_table_async()
+            except Exception as e:
+                # The table exists unless this is the very first start; keep listening for changes either way
+                logger.warning(f"Could not check the questions table: {e}")
+            await PromptQuestion.start_listener()
+            logger.info("Successfully connected to Postgres")
+        except Exception as e:
+            # Next-question suggestions fall back to per-call connections
+            logger.warning(f"Postgres pool unavailable: {e}")
         yield
     finally:
         # Shutdown: Close connection
         await MongoDB.close_db()
         logger.info("Mongo Database connection closed")
-        #await PostgresDB.close_db()
+        await PromptQuestion.stop_listener()
+        await PostgresDB.close_db()
 
 
 app = FastAPI(
@@ -84,6 +104,7 @@ app.add_middleware(
 # Include routers
 #app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(chat.router, prefix="/api/chat", tags=["Chat"])
+app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
 
 # Health check endpoint
 @app.get("/api/health")
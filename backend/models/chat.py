@@ -40,6 +40,15 @@ class ChatSession(BaseModel):
     messages: List[ChatMessage] = []
 
 
+class ChatSessionSummary(BaseModel):
+    """Sidebar entry for a session, without its messages"""
+    id: str
+    title: str
+    persona: Optional[str] = None
+    timestamp: datetime
+    last_message: Optional[str] = None
+
+
 class Dataset(BaseModel):
     records: List[Dict[str, Any]]  # Array of objects representing rows
     columns: List[str]  # Column names
@@ -48,13 +48,15 @@ flowchart
 
 """
 
+import asyncio
+import dataclasses
 import json
 import os
 import re
 import sqlite3
 import traceback
 from abc import ABC, abstractmethod
-from typing import List, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 from urllib.parse import urlparse
 
 from sqlalchemy import create_engine, text
@@ -67,8 +69,14 @@ import requests
 
 
 from ..exceptions import DependencyError, ImproperlyConfigured, ValidationError
-from ..types import TrainingPlan, TrainingPlanItem
+from ..types import RelatedTrainingData, TrainingPlan, TrainingPlanItem
 from ..utils import validate_config_path
+from ..result_fetch import BoundedResultFetcher
+from ..prompt_builder import PromptBuilder, PromptSection, count_tokens
+from ..schema_graph import SchemaGraph
+from ..sql_templates import SqlTemplateCache
+from ..sql_validation import SqlValidator
+from ..query_cache import QueryResultCache
 # from ..cachepg import CacheManager
 
 class SahdevBase(ABC):
@@ -82,6 +90,42 @@ class SahdevBase(ABC):
         self.dialect = self.config.get("dialect", "SQL")
         self.language = self.config.get("language", None)
         self.max_tokens = self.config.get("max_tokens", 14000)
+        self.prompt_builder = PromptBuilder(
+            max_tokens=self.max_tokens,
+            model=self.config.get("model", "gpt-4"),
+            budgets=self.config.get("prompt_section_budgets"),
+        )
+        # Opt-in: replace retrieved DDL chunks with a pruned, connected schema subgraph
+        self.use_schema_graph = self.config.get("schema_graph", False)
+        self.schema_graph_max_columns = self.config.get("schema_graph_max_columns", 15)
+        self._schema_graph = None
+        self._schema_graph_generation = None
+        # Opt-in: trained questions that differ from the asked one only in a literal are answered without the LLM
+        self.use_sql_templates = self.config.get("sql_templates", False)
+        self.sql_templates = SqlTemplateCache(max_templates=self.config.get("sql_template_cache_size", 4096))
+        # Generated SQL is parsed and checked against the DDL training data before it reaches the database
+        self.use_sql_validation = self.config.get("sql_validation", True)
+        self.sql_validation_schema = self.config.get("sql_validation_schema", True)
+        self.sql_validator = SqlValidator(dialect=self.config.get("sql_validation_dialect", "tsql"))
+        # Speculative mode: ask for this many SQL candidates at once and run the first one that compiles
+        self.speculative_candidates = self.config.get("speculative_candidates", 1)
+        self.speculative_temperature = self.config.get("speculative_temperature", 0.7)
+        # Results of equivalent queries are served from disk until their tables' TTL or invalidation
+        self.query_cache = None
+        if self.config.get("query_cache_dir"):
+            self.query_cache = QueryResultCache(
+                directory=self.config["query_cache_dir"],
+                ttl=self.config.get("query_cache_ttl", 600),
+                table_ttls=self.config.get("query_cache_table_ttls"),
+                size_limit=self.config.get("query_cache_size_limit", 2 ** 29),
+            )
+        # Ceilings applied to query results fetched by the connect_to_* helpers
+        self.result_fetcher = BoundedResultFetcher(
+            max_rows=self.config.get("max_result_rows", 5000),
+            max_bytes=self.config.get("max_result_bytes", 50 * 1024 * 1024),
+            chunk_size=self.config.get("fetch_chunk_size", 1000),
+            add_top=self.config.get("inject_top", True),
+        )
 
     def log(self, message: str, title: str = "Info"):
         print(f"{title}: {message}")
@@ -93,75 +137,155 @@ class SahdevBase(ABC):
         return f"Respond in the {self.language} language."
 
     def generate_sql(self, question: str,context_str:str ,allow_llm_to_see_data=False, **kwargs) -> str:
+        related = self.refine_related_training_data(question, self.get_related_training_data(question, **kwargs))
+        steps = self._sql_generation_steps(question, context_str, related, allow_llm_to_see_data, **kwargs)
 
-        if self.config is not None:
-            initial_prompt = self.config.get("initial_prompt", None)
-        else:
-            initial_prompt = None
-        question_sql_list = self.get_similar_question_sql(question, **kwargs)
-        ddl_list = self.get_related_ddl(question, **kwargs)
-        doc_list = self.get_related_documentation(question, **kwargs)
-        rel_list=self.get_related_relations(question, **kwargs)
-        prompt = self.get_sql_prompt(
+        try:
+            step, value = next(steps)
+            while True:
+                try:
+                    result = self.submit_prompt(value, **kwargs) if step == "llm" else self.run_sql(value)
+                except Exception as e:
+                    step, value = steps.throw(e)
+                else:
+                    step, value = steps.send(result)
+        except StopIteration as done:
+            return done.value
+
+    async def generate_sql_async(self, question: str, context_str: str, allow_llm_to_see_data=False, **kwargs) -> str:
+        """
+        Async counterpart of `generate_sql`. Retrieval and intermediate SQL run in worker threads,
+        the LLM calls go through `submit_prompt_async`, so many questions can be in flight on one
+        event loop.
+        """
+        related = await asyncio.to_thread(self.get_related_training_data, question, **kwargs)
+        related = await asyncio.to_thread(self.refine_related_training_data, question, related)
+        steps = self._sql_generation_steps(question, context_str, related, allow_llm_to_see_data, **kwargs)
+
+        try:
+            step, value = next(steps)
+            while True:
+                try:
+                    if step == "llm":
+                        result = await self.submit_prompt_async(value, **kwargs)
+                    else:
+                        result = await asyncio.to_thread(self.run_sql, value)
+                except Exception as e:
+                    step, value = steps.throw(e)
+                else:
+                    step, value = steps.send(result)
+        except StopIteration as done:
+            return done.value
+
+    def _sql_prompt(self, question: str, context_str: str, related: RelatedTrainingData, extra_rel: Optional[List[str]] = None, **kwargs):
+        initial_prompt = self.config.get("initial_prompt", None) if self.config is not None else None
+        return self.get_sql_prompt(
             initial_prompt=initial_prompt,
             question=question,
             context_str=context_str,
-            question_sql_list=question_sql_list,
-            ddl_list=ddl_list,
-            doc_list=doc_list,
-            rel_list=rel_list,
+            question_sql_list=related.question_sql_list,
+            ddl_list=related.ddl_list,
+            doc_list=related.doc_list,
+            rel_list=related.rel_list + (extra_rel or []),
+            related=related,
             **kwargs,
         )
 
+    def _sql_generation_steps(self, question: str, context_str: str, related: RelatedTrainingData, allow_llm_to_see_data=False, **kwargs):
+        """
+        The SQL generation flow shared by `generate_sql` and `generate_sql_async`, as a generator
+        that leaves the I/O to its caller: it yields ("llm", prompt) and ("sql", intermediate_sql),
+        is sent the LLM response or the DataFrame (or has the exception thrown in), and returns
+        the SQL or an error message.
+        """
+        trained_sql = self.match_trained_sql(question, related.question_sql_list)
+        if trained_sql is not None:
+            return trained_sql
 
-        # Iterate through each item in the list
-        for item in question_sql_list:
-            # Check if the current item's question matches the input question
-            if item['question'] == question:
-                # If a match is found, return the corresponding sql value
-                self.log(title="Question matched",message="Returning the SQL")
-
-                return item['sql']
-        self.log(title="Question not matched",message="continuing with RAG")
-
+        prompt = self._sql_prompt(question, context_str, related, **kwargs)
         self.log(title="SQL Prompt", message=prompt)
-        #self.log(title="The prompt type is",message=type(prompt))
 
-        llm_response = self.submit_prompt(prompt, **kwargs)
+        llm_response = yield "llm", prompt
         self.log(title="LLM Response", message=llm_response)
 
         if 'intermediate_sql' in llm_response:
             if not allow_llm_to_see_data:
                 return "The LLM is not allowed to see the data in your database. Your question requires database introspection to generate the necessary SQL. Please set allow_llm_to_see_data=True to enable this."
 
-            if allow_llm_to_see_data:
-                intermediate_sql = self.extract_sql(llm_response)
-
-                try:
-                    self.log(title="Running Intermediate SQL", message=intermediate_sql)
-                    df = self.run_sql(intermediate_sql)
-
-                    prompt = self.get_sql_prompt(
-                        initial_prompt=initial_prompt,
-                        context_str=context_str,
-                        question=question,
-                        question_sql_list=question_sql_list,
-                        ddl_list=ddl_list,
-                        doc_list=doc_list,
-                        rel_list=rel_list+[f"The following is a pandas DataFrame with the results of the intermediate SQL query {intermediate_sql}: \n" + df.to_markdown()],
-                        **kwargs,
-                    )
-                    self.log(title="Final SQL Prompt", message=prompt)
-                    self.log(title="The prompt type is",message=type(prompt))
-                    llm_response = self.submit_prompt(prompt, **kwargs)
-                    self.log(title="LLM Response", message=llm_response)
-                except Exception as e:
-                    return f"Error running intermediate SQL: {e}"
+            intermediate_sql = self.extract_sql(llm_response)
 
+            try:
+                self.log(title="Running Intermediate SQL", message=intermediate_sql)
+                df = yield "sql", intermediate_sql
+
+                prompt = self._sql_prompt(
+                    question,
+                    context_str,
+                    related,
+                    extra_rel=[f"The following is a pandas DataFrame with the results of the intermediate SQL query {intermediate_sql}: \n" + df.to_markdown()],
+                    **kwargs,
+                )
+                self.log(title="Final SQL Prompt", message=prompt)
+                llm_response = yield "llm", prompt
+                self.log(title="LLM Response", message=llm_response)
+            except Exception as e:
+                return f"Error running intermediate SQL: {e}"
 
         return self.extract_sql(llm_response)
-    
-    
+
+    def match_trained_sql(self, question: str, question_sql_list: list) -> Optional[str]:
+        """
+        Example:
+        ```python
+        sql = sd.match_trained_sql("Top 5 customers for Domestic", related.question_sql_list)
+        ```
+
+        Returns the SQL of a retrieved example whose question is identical to `question`, or
+        (with `sql_templates` enabled) that differs only in string, number or month literals,
+        with the new literals bound in. No LLM call is made.
+
+        Args:
+            question (str): The question asked.
+            question_sql_list (list): The retrieved question/SQL examples.
+
+        Returns:
+            str or None: The SQL, or None when the question has to go to the LLM.
+        """
+        sql = self.sql_templates.lookup(question, question_sql_list, templates=self.use_sql_templates)
+        stats = self.sql_templates.stats()
+        if sql is None:
+            self.log(title="Question not matched", message=f"continuing with RAG (trained SQL hit rate {stats['hit_rate']:.1%})")
+        else:
+            self.log(title="Question matched", message=f"Returning the SQL (trained SQL hit rate {stats['hit_rate']:.1%})")
+        return sql
+
+    async def generate_sql_candidates_async(self, question: str, context_str: str, k: int, **kwargs) -> List[str]:
+        """
+        Builds the SQL prompt once and asks the LLM for `k` completions of it. Returns the
+        distinct SQL candidates in the order the LLM gave them; responses that ask for an
+        intermediate query are dropped. A trained or templated match is the only candidate.
+        """
+        related = await asyncio.to_thread(self.get_related_training_data, question, **kwargs)
+        related = await asyncio.to_thread(self.refine_related_training_data, question, related)
+
+        trained_sql = self.match_trained_sql(question, related.question_sql_list)
+        if trained_sql is not None:
+            return [trained_sql]
+
+        prompt = self._sql_prompt(question, context_str, related, **kwargs)
+        self.log(title="SQL Prompt", message=prompt)
+
+        llm_responses = await self.submit_prompt_candidates_async(prompt, k, **kwargs)
+        candidates = []
+        for llm_response in llm_responses:
+            if not llm_response or 'intermediate_sql' in llm_response:
+                continue
+            sql = self.extract_sql(llm_response)
+            if sql not in candidates:
+                candidates.append(sql)
+        self.log(title="SQL Candidates", message=f"{len(candidates)} distinct of {len(llm_responses)} responses")
+        return candidates
+
     def return_sql(self,prompt, **kwargs):
         llm_response = self.submit_prompt(prompt, **kwargs)
         self.log(title="LLM Response", message=llm_response)
@@ -194,31 +318,16 @@ class SahdevBase(ABC):
                     sql = self.generate_sql(question=question,context_str=context_str)
                 else:
                     # For retries, include the previous SQL and error in the prompt
-                    prompt = f"""
-                    Your previous SQL query for the question "{question}" failed with the following error:
-                    {error_message}
-                    
-                    The failing query was:
-                    {sql}
-                   
-                    Please provide a corrected SQL query that addresses this error. Note - but if the user is greeting you, for example, saying "hi" or something similar, respond to them politely without generating SQL.
-                    """
+                    prompt = self._retry_prompt(question, sql, error_message)
                     sql = self.generate_sql(question=prompt,context_str=context_str)
-                
-                # Execute SQL
-                df = self.run_sql(sql)
-                
-                # Check if df is a valid DataFrame
-                if not isinstance(df, pd.DataFrame):
-                    raise TypeError(f"Expected a pandas DataFrame, but got {type(df).__name__}")
-                
-                # Check if df is empty
-                if df.empty:
-                    return sql, df, "🌟 No Data Found 🌟\n Maybe it’s a fresh start for this combination! 🕊️ .\n If you think something’s amiss, try refining your query or let us know. 😊"
 
+                # Reject broken or non-SELECT SQL before it costs a database round trip
+                self.check_generated_sql(sql)
 
+                # Execute SQL
+                df = self.run_sql(sql)
                 
-                return sql, df, "Query Executed Sucessfully"
+                return self._query_result(sql, df)
             
             except Exception as e:
                 error_message = str(e)
@@ -228,11 +337,195 @@ class SahdevBase(ABC):
         fallback_response = self.generate_fallback_response(question, error_message,context_str)
         return sql, df, fallback_response
 
+    async def execute_query_with_retries_async(self, question: str, context_str: str, max_retries: int = 3, on_sql=None) -> Tuple[Optional[str], Optional[pd.DataFrame], str]:
+        """
+        Async counterpart of `execute_query_with_retries`. SQL generation and the fallback use the
+        async LLM client; the blocking database call runs in a worker thread.
+        `on_sql`, if given, is called with every generated SQL before it is executed.
+        """
+        sql = ''
+        df = None
+        error_message = ''
+        first_attempt = 0
+
+        if self.speculative_candidates > 1 and max_retries > 0:
+            # One round of k candidates replaces the first serial attempt; failures continue
+            # with the usual retry prompt
+            first_attempt = 1
+            try:
+                sql, error = await self._first_valid_candidate_async(question, context_str)
+                if error is not None:
+                    raise error
+                if on_sql is not None:
+                    on_sql(sql)
+                df = await asyncio.to_thread(self.run_sql, sql)
+                return self._query_result(sql, df)
+            except Exception as e:
+                error_message = str(e)
+                print(f"Attempt 1 failed. Error: {error_message}")
+
+        for attempt in range(first_attempt, max_retries):
+            try:
+                if attempt == 0:
+                    sql = await self.generate_sql_async(question=question, context_str=context_str)
+                else:
+                    prompt = self._retry_prompt(question, sql, error_message)
+                    sql = await self.generate_sql_async(question=prompt, context_str=context_str)
+
+                await asyncio.to_thread(self.check_generated_sql, sql)
+
+                if on_sql is not None:
+                    on_sql(sql)
+
+                df = await asyncio.to_thread(self.run_sql, sql)
+
+                return self._query_result(sql, df)
+
+            except Exception as e:
+                error_message = str(e)
+                print(f"Attempt {attempt + 1} failed. Error: {error_message}")
+
+        fallback_response = await self.generate_fallback_response_async(question, error_message, context_str)
+        return sql, df, fallback_response
+
+    async def _first_valid_candidate_async(self, question: str, context_str: str) -> Tuple[str, Optional[Exception]]:
+        """
+        Generates `speculative_candidates` SQL candidates and validates them concurrently with
+        `check_generated_sql` and `validate_sql`, even when only one distinct candidate is left.
+        Returns the first candidate to pass, with the other validations cancelled, or the first
+        candidate and its validation error when none passes.
+        """
+        candidates = await self.generate_sql_candidates_async(question, context_str, self.speculative_candidates)
+        if not candidates:
+            return "", ValueError("The LLM did not return an SQL query")
+
+        async def check(sql: str):
+            try:
+                await asyncio.to_thread(self.check_generated_sql, sql)
+                await asyncio.to_thread(self.validate_sql, sql)
+                return sql, None
+            except Exception as e:
+                return sql, e
+
+        tasks = [asyncio.create_task(check(sql)) for sql in candidates]
+        errors = {}
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                sql, error = await next_done
+                if error is None:
+                    self.log(title="SQL Candidate", message=f"Using candidate {candidates.index(sql) + 1} of {len(candidates)}")
+                    return sql, None
+                errors[sql] = error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        return candidates[0], errors[candidates[0]]
+
+    def check_generated_sql(self, sql: str) -> None:
+        """
+        Example:
+        ```python
+        sd.check_generated_sql("SELECT TOP 10 * FROM SalesOrders")
+        ```
+
+        Local validation of generated SQL, without a database round trip: it must parse, be a
+        single SELECT, and (with `sql_validation_schema`) only use columns that exist in the tables
+        of the DDL training data; tables that are not in it are left to the database. Does nothing
+        with `sql_validation` off or without sqlglot.
+
+        Args:
+            sql (str): The generated SQL.
+
+        Raises:
+            ValidationError: With a message that can be fed back into the retry prompt.
+        """
+        if not self.use_sql_validation or not self.sql_validator.available:
+            return
+
+        schema = None
+        if self.sql_validation_schema:
+            schema = {key: set(table.columns) for key, table in self.get_schema_graph().tables.items()}
+        try:
+            self.sql_validator.validate(sql, schema)
+        except ValidationError as e:
+            self.log(title="SQL rejected before execution", message=str(e))
+            raise
+
+    def validate_sql(self, sql: str) -> None:
+        """
+        Example:
+        ```python
+        sd.validate_sql("SELECT * FROM my_table")
+        ```
+
+        Checks that `sql` compiles against the connected database without running it, raising
+        the database error if it does not. The connect_to_* helpers that support a compile-only
+        check replace this default, which accepts every query.
+
+        Args:
+            sql (str): The SQL query to check.
+        """
+        return None
+
+    def _retry_prompt(self, question: str, sql: str, error_message: str) -> str:
+        return f"""
+                    Your previous SQL query for the question "{question}" failed with the following error:
+                    {error_message}
+                    
+                    The failing query was:
+                    {sql}
+                   
+                    Please provide a corrected SQL query that addresses this error. Note - but if the user is greeting you, for example, saying "hi" or something similar, respond to them politely without generating SQL.
+                    """
+
+    def _query_result(self, sql: str, df) -> Tuple[str, pd.DataFrame, str]:
+        # Check if df is a valid DataFrame
+        if not isinstance(df, pd.DataFrame):
+            raise TypeError(f"Expected a pandas DataFrame, but got {type(df).__name__}")
+
+        # Check if df is empty
+        if df.empty:
+            return sql, df, "🌟 No Data Found 🌟\n Maybe it’s a fresh start for this combination! 🕊️ .\n If you think something’s amiss, try refining your query or let us know. 😊"
+
+        return sql, df, "Query Executed Sucessfully"
+
     def generate_fallback_response(self, question: str, last_error: str,context_str: str) -> str:
         """
         Generates a fallback response when SQL generation or execution fails.
         """
-        prompt = f"""
+        resp = self.client.chat.completions.create(
+            model='gpt-4',
+            messages=[
+                {
+                    "role": "user",
+                    "content": self._fallback_prompt(question),
+                },
+            ]
+        )
+        return resp.choices[0].message.content
+
+    async def generate_fallback_response_async(self, question: str, last_error: str, context_str: str) -> str:
+        """
+        Async counterpart of `generate_fallback_response`, using `async_client` when one is configured.
+        """
+        async_client = getattr(self, "async_client", None)
+        if async_client is None:
+            return await asyncio.to_thread(self.generate_fallback_response, question, last_error, context_str)
+
+        resp = await async_client.chat.completions.create(
+            model='gpt-4',
+            messages=[
+                {
+                    "role": "user",
+                    "content": self._fallback_prompt(question),
+                },
+            ]
+        )
+        return resp.choices[0].message.content
+
+    def _fallback_prompt(self, question: str) -> str:
+        return f"""
         I couldn't generate a valid SQL query to answer your question: "{question}". 
         However, here's some general advice or information related to your query. If you are greeting me or asking a generic question, let me know, and I'll respond accordingly.
 
@@ -250,16 +543,6 @@ class SahdevBase(ABC):
         
 
         """
-        resp = self.client.chat.completions.create(
-            model='gpt-4',
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                },
-            ]
-        )
-        return resp.choices[0].message.content
 
 
 
@@ -398,6 +681,122 @@ class SahdevBase(ABC):
 
 
 
+    def get_related_training_data(self, question: str, **kwargs) -> RelatedTrainingData:
+        """
+        Example:
+        ```python
+        related = sd.get_related_training_data("What are the top 10 customers by sales?")
+        ```
+
+        Fetches similar question-SQL pairs, DDL, documentation and relations for a question in one call.
+        The default implementation calls the four `get_` methods one after another; vector stores that can
+        embed the question once and query every collection together should override it.
+
+        Args:
+            question (str): The question to retrieve training data for.
+
+        Returns:
+            RelatedTrainingData: The retrieved training data, best match first.
+        """
+        return RelatedTrainingData(
+            question_sql_list=self.get_similar_question_sql(question, **kwargs),
+            ddl_list=self.get_related_ddl(question, **kwargs),
+            doc_list=self.get_related_documentation(question, **kwargs),
+            rel_list=self.get_related_relations(question, **kwargs),
+        )
+
+    def get_schema_graph(self) -> SchemaGraph:
+        """
+        Example:
+        ```python
+        graph = sd.get_schema_graph()
+        ```
+
+        The schema graph of all DDL and relations training data, rebuilt when the training
+        data generation changes.
+
+        Returns:
+            SchemaGraph: Tables and the joins between them.
+        """
+        generation = self.get_training_generation()
+        if self._schema_graph is None or self._schema_graph_generation != generation:
+            training_data = self.get_training_data()
+            if training_data.empty:
+                ddl_list, relations_list = [], []
+            else:
+                ddl_list = training_data.loc[training_data["training_data_type"] == "ddl", "content"].tolist()
+                relations_list = training_data.loc[training_data["training_data_type"] == "relations", "content"].tolist()
+            self._schema_graph = SchemaGraph.from_training_data(ddl_list, relations_list)
+            self._schema_graph_generation = generation
+            self.log(title="Schema graph", message=f"Built from {len(ddl_list)} DDL and {len(relations_list)} relations entries, {len(self._schema_graph.tables)} tables")
+        return self._schema_graph
+
+    def refine_related_training_data(self, question: str, related: RelatedTrainingData) -> RelatedTrainingData:
+        """
+        With `schema_graph` enabled, replaces the retrieved DDL chunks by the DDL of the smallest
+        connected set of tables that joins the retrieved ones (and those used by the retrieved
+        example SQL), trimmed to the relevant columns, and adds the join conditions between
+        them as the first relations entry. Otherwise returns `related` unchanged.
+        """
+        if not self.use_schema_graph:
+            return related
+
+        graph = self.get_schema_graph()
+        example_sql = [example.get("sql", "") for example in related.question_sql_list if isinstance(example, dict)]
+
+        # Tables inherit the similarity of the chunk they were retrieved in
+        table_scores = {}
+        unparsed_ddl, unparsed_scores = [], []
+        for position, ddl in enumerate(related.ddl_list):
+            score = related.ddl_scores[position] if position < len(related.ddl_scores) else 0.0
+            tables = graph.tables_defined_in([ddl])
+            if not tables:
+                unparsed_ddl.append(ddl)
+                unparsed_scores.append(score)
+            for table in tables:
+                table_scores[table] = max(score, table_scores.get(table, score))
+
+        terminals = list(table_scores) + graph.tables_used_in(example_sql)
+        if not terminals:
+            return related
+
+        tables = graph.connect(terminals)
+        # Connector tables rank just below the weakest retrieved one
+        floor = min(table_scores.values(), default=0.0)
+        ddl_list = graph.render(tables, question, hints=example_sql, max_columns=self.schema_graph_max_columns)
+        ddl_scores = [table_scores.get(table, floor) for table in tables]
+
+        rel_list, rel_scores = list(related.rel_list), list(related.rel_scores)
+        joins = graph.join_conditions(tables)
+        if joins:
+            rel_list.insert(0, "Join conditions:\n" + "\n".join(joins))
+            rel_scores.insert(0, 1.0)
+
+        self.log(title="Schema graph", message=f"Terminals {terminals} -> tables {tables}")
+        return dataclasses.replace(
+            related,
+            ddl_list=ddl_list + unparsed_ddl,
+            ddl_scores=ddl_scores + unparsed_scores,
+            rel_list=rel_list,
+            rel_scores=rel_scores,
+        )
+
+    def get_training_generation(self, **kwargs) -> str:
+        """
+        Example:
+        ```python
+        sd.get_training_generation()
+        ```
+
+        Returns an opaque version string of the training data. It changes whenever DDL, documentation,
+        relations or question-SQL pairs are added or removed, so caches of generated answers can be scoped
+        to it. Vector stores that cannot tell return a constant.
+
+        Returns:
+            str: The training data generation.
+        """
+        return "0"
+
     # ----------------- Use Any Embeddings API ----------------- #
     @abstractmethod
     def generate_embedding(self, data: str, **kwargs) -> List[float]:
@@ -490,6 +889,61 @@ class SahdevBase(ABC):
         """
         pass
 
+    def add_many(self, kind: str, items: list, batch_size: int = 256, **kwargs) -> List[str]:
+        """
+        Example:
+        ```python
+        sd.add_many("ddl", ddl_statements)
+        sd.add_many("sql", [{"question": "How many orders?", "sql": "SELECT COUNT(*) FROM SalesOrders"}])
+        ```
+
+        Adds many items of one kind of training data: "ddl", "documentation" and "relations"
+        take strings, "sql" takes {"question", "sql"} dicts or (question, sql) pairs. This
+        default adds them one at a time; vector stores override it with a batched path.
+
+        Returns:
+            List[str]: The IDs of the training data that was added, in the order of `items`.
+        """
+        add = {
+            "ddl": self.add_ddl,
+            "documentation": self.add_documentation,
+            "relations": self.add_relations,
+        }.get(kind)
+        if kind == "sql":
+            pairs = [(item["question"], item["sql"]) if isinstance(item, dict) else tuple(item) for item in items]
+            return [self.add_question_sql(question=question, sql=sql) for question, sql in pairs]
+        if add is None:
+            raise ValidationError(f"Unknown training data kind {kind!r}, expected 'ddl', 'documentation', 'relations' or 'sql'")
+        return [add(item) for item in items]
+
+    def train_from_plan(self, plan: TrainingPlan, batch_size: int = 256) -> Dict[str, List[str]]:
+        """
+        Example:
+        ```python
+        plan = TrainingPlan([
+            TrainingPlanItem(item_type=TrainingPlanItem.ITEM_TYPE_DDL, item_group="dbo", item_name="SalesOrders", item_value=ddl),
+        ])
+        sd.train_from_plan(plan)
+        ```
+
+        Trains on every item of `plan` with `add_many`, one call per kind: DDL items as DDL,
+        information schema items as documentation and SQL items as question/SQL pairs
+        (the item name is the question).
+
+        Returns:
+            Dict[str, List[str]]: The IDs that were added, per kind.
+        """
+        grouped = {"ddl": [], "documentation": [], "sql": []}
+        for item in plan._plan:
+            if item.item_type == TrainingPlanItem.ITEM_TYPE_DDL:
+                grouped["ddl"].append(item.item_value)
+            elif item.item_type == TrainingPlanItem.ITEM_TYPE_IS:
+                grouped["documentation"].append(item.item_value)
+            elif item.item_type == TrainingPlanItem.ITEM_TYPE_SQL:
+                grouped["sql"].append((item.item_name, item.item_value))
+
+        return {kind: self.add_many(kind, items, batch_size=batch_size) for kind, items in grouped.items() if items}
+
     @abstractmethod
     def get_training_data(self, **kwargs) -> pd.DataFrame:
         """
@@ -538,36 +992,55 @@ class SahdevBase(ABC):
         pass
 
     def str_to_approx_token_count(self, string: str) -> int:
-        return len(string) / 4
-    
+        return count_tokens(string, self.prompt_builder.model)
+
+    def _add_items_to_prompt(self, initial_prompt: str, heading: str, items: list, max_tokens: int, render=str) -> str:
+        # Count the prompt once and keep a running total, instead of re-measuring it after every append
+        if len(items) == 0:
+            return initial_prompt
+
+        parts = [initial_prompt, heading]
+        used = self.str_to_approx_token_count(initial_prompt + heading)
+        for item in items:
+            text = render(item)
+            tokens = self.str_to_approx_token_count(text)
+            if used + tokens < max_tokens:
+                parts.append(f"{text}\n\n")
+                used += tokens
+
+        return "".join(parts)
+
     def add_context_to_prompt(
         self,
         initial_prompt: str,
         context_str:str,
         max_tokens: int = 14000,
     ) -> str:
-        
-        initial_prompt += "\n===Previous Chatbot Conversations \n\n"
-
-        initial_prompt+=f"{context_str}\n\n"
-
-        return initial_prompt
+        heading = "\n===Previous Chatbot Conversations \n\n"
+        # Keep the newest turns that fit
+        budget = max_tokens - self.str_to_approx_token_count(initial_prompt + heading)
+        turns = self._split_context(context_str)
+        kept = []
+        for turn in reversed(turns):
+            tokens = self.str_to_approx_token_count(turn)
+            if tokens > budget:
+                break
+            kept.append(turn)
+            budget -= tokens
+
+        return initial_prompt + heading + "\n".join(reversed(kept)) + "\n\n"
+
+    @staticmethod
+    def _split_context(context_str: str) -> list:
+        """Splits a session context string (see GetContext.get_session_context) into its turns"""
+        if not context_str:
+            return []
+        return [turn for turn in re.split(r"\n(?=User Question |Bot Response )", context_str) if turn]
 
     def add_ddl_to_prompt(
         self, initial_prompt: str, ddl_list: list[str], max_tokens: int = 14000
     ) -> str:
-        if len(ddl_list) > 0:
-            initial_prompt += "\n===Tables \n"
-
-            for ddl in ddl_list:
-                if (
-                    self.str_to_approx_token_count(initial_prompt)
-                    + self.str_to_approx_token_count(ddl)
-                    < max_tokens
-                ):
-                    initial_prompt += f"{ddl}\n\n"
-
-        return initial_prompt
+        return self._add_items_to_prompt(initial_prompt, "\n===Tables \n", ddl_list, max_tokens)
 
     def add_documentation_to_prompt(
         self,
@@ -575,58 +1048,28 @@ class SahdevBase(ABC):
         documentation_list: list[str],
         max_tokens: int = 14000,
     ) -> str:
-        if len(documentation_list) > 0:
-            initial_prompt += "\n===Additional Context \n\n"
-
-            for documentation in documentation_list:
-                if (
-                    self.str_to_approx_token_count(initial_prompt)
-                    + self.str_to_approx_token_count(documentation)
-                    < max_tokens
-                ):
-                    initial_prompt += f"{documentation}\n\n"
-
-        return initial_prompt
-    
+        return self._add_items_to_prompt(initial_prompt, "\n===Additional Context \n\n", documentation_list, max_tokens)
+
     def add_relations_to_prompt(
         self,
         initial_prompt: str,
         relations_list: list[str],
         max_tokens: int = 14000,
     ) -> str:
-        if len(relations_list) > 0:
-            initial_prompt += "\n=== The relationship between the tables \n\n"
-
-            for relations in relations_list:
-                if (
-                    self.str_to_approx_token_count(initial_prompt)
-                    + self.str_to_approx_token_count(relations)
-                    < max_tokens
-                ):
-                    initial_prompt += f"{relations}\n\n"
-
-        return initial_prompt
-    
-
+        return self._add_items_to_prompt(
+            initial_prompt, "\n=== The relationship between the tables \n\n", relations_list, max_tokens
+        )
 
     def add_sql_to_prompt(
         self, initial_prompt: str, sql_list: list[str], max_tokens: int = 14000
     ) -> str:
-        if len(sql_list) > 0:
-            initial_prompt += "\n===Question-SQL Pairs\n\n"
-
-            for question in sql_list:
-                if (
-                    self.str_to_approx_token_count(initial_prompt)
-                    + self.str_to_approx_token_count(question["sql"])
-                    < max_tokens
-                ):
-                    initial_prompt += f"{question['question']}\n{question['sql']}\n\n"
-
-        return initial_prompt
-    
-
-
+        return self._add_items_to_prompt(
+            initial_prompt,
+            "\n===Question-SQL Pairs\n\n",
+            sql_list,
+            max_tokens,
+            render=lambda question: f"{question['question']}\n{question['sql']}",
+        )
 
     def get_sql_prompt(
         self,
@@ -637,6 +1080,7 @@ class SahdevBase(ABC):
         ddl_list: list,
         doc_list: list,
         rel_list :list,
+        related: Optional[RelatedTrainingData] = None,
         **kwargs,
     ):
         """
@@ -658,6 +1102,8 @@ class SahdevBase(ABC):
             question_sql_list (list): A list of questions and their corresponding SQL statements.
             ddl_list (list): A list of DDL statements.
             doc_list (list): A list of documentation.
+            related (RelatedTrainingData): The retrieval result the lists came from; its scores
+                rank the entries when they do not all fit in `max_tokens`.
 
         Returns:
             any: The prompt for the LLM to generate SQL.
@@ -668,58 +1114,7 @@ class SahdevBase(ABC):
             "Generate a SQL query to answer the question based strictly on the provided **CONTEXT** (DDL(Tables), Additional context(Documentations), Relations between the tables and Question SQL pairs ) and **HISTORY** (Previous Questions Context). First, determine if the question is a **follow-up** (build on prior queries) or a **new question** (standalone query), and craft the query accordingly. Ensure your response adheres to the **response guidelines**
            """
 
-        initial_prompt += (
-            f"\n\n Previous Questions Context : ****PREVIOUS 3 QUESTIONS ASKED BY USER and SQL queries are**** \n {context_str} =========="
-        )
-
-        initial_prompt += (
-            f"\n\n  ======**OVERALLN CONTEXT FOR SQL QUERY (given below) : **======="
-        )
-
-
-            ###Histpory addition#####
-        initial_prompt = self.add_ddl_to_prompt(
-            initial_prompt, ddl_list, max_tokens=self.max_tokens
-        )
-
-
-
-        if self.static_documentation != "":
-            doc_list.append(self.static_documentation)
-
-        initial_prompt = self.add_documentation_to_prompt(
-            initial_prompt, doc_list, max_tokens=self.max_tokens
-        )
-
-        initial_prompt = self.add_relations_to_prompt(
-            initial_prompt,rel_list, max_tokens=self.max_tokens
-        )
-
-        # initial_prompt += (
-        #     "===Response Guidelines \n"
-        #     "1. If the provided context is sufficient, please generate a valid SQL query without any explanations for the question. Also donot make any ambiguous queries, always crosscheck if the query which are made are valid according to the asked question or not. If you need further clarification on question, you can refer to the previously asked questions and thier SQL given below these guidelines\n"
-        #     "2. If the provided context is almost sufficient but requires knowledge of a specific string in a particular column, Please refer the recent conversation history which is given below after these instructions \n"
-        #     "3. If the provided context is insufficient, please check if the question is based on the recent conversation history given below and weather the users wanted to ask a followup question on already asked questions or not  \n"
-        #     "4. Please use the most relevant table(s). \n"
-        #     "5. If the question has been asked and answered before, please repeat the answer exactly as it was given before. \n"
-        #     f"6. Ensure that the output SQL is {self.dialect}-compliant and executable, and free of syntax errors. \n"
-        # )
-
-#             1. **Follow-Up vs. New Question**:
-#             - First, determine if the current question is a **follow-up** to a previous query in the **HISTORY**.
-#             - If it is a follow-up, modify or extend the previous query to accommodate the new requirements while maintaining the logic of the earlier query.
-#             - If it is a new question, generate a standalone SQL query based on the given **CONTEXT**.
-
-#             2. **Adherence to History**:
-#             - Use the results or logic of the previous query (if applicable) as the basis for updates in the follow-up question.
-#             - For example, if a new column or condition is requested, update the prior query rather than creating a new one from scratch.
-
-#             3. **Optimization and Accuracy**:
-#             - Ensure all queries are syntactically correct, optimized for performance, and address potential edge cases (e.g., null values or mismatched joins).
-
-#             Now, based on the **CONTEXT** and **HISTORY**, intelligently determine whether the question is a follow-up or a new question, adapt the SQL query accordingly, and provide the updated result.
-
-        initial_prompt += (
+        guidelines = (
             "===Response Guidelines \n"
             "1. If the provided context is sufficient, please generate a valid SQL query without any explanations for the question. \n"
             "2. If the provided context is almost sufficient but requires knowledge of a specific string in a particular column, please generate an intermediate SQL query to find the distinct strings in that column. Prepend the query with a comment saying intermediate_sql \n"
@@ -733,19 +1128,59 @@ class SahdevBase(ABC):
             "8. If the question has been asked and answered before, please repeat the answer exactly as it was given before. \n"
             f"9. Ensure that the output SQL is {self.dialect}-compliant and executable, and free of syntax errors. \n"
         )
-        
-        
-        
-        
-        message_log = [self.system_message(initial_prompt)]
 
-        for example in question_sql_list:
-            if example is None:
-                print("example is None")
-            else:
-                if example is not None and "question" in example and "sql" in example:
-                    message_log.append(self.user_message(example["question"]))
-                    message_log.append(self.assistant_message(example["sql"]))
+        related = related or RelatedTrainingData()
+        doc_list = list(doc_list)
+        if self.static_documentation != "":
+            doc_list.append(self.static_documentation)
+
+        def ranked(scores: list, items: list) -> list:
+            # Entries the caller added beyond the retrieved ones (static documentation, intermediate
+            # SQL results) have no similarity score; they were added on purpose, so they rank first
+            return list(scores[:len(items)]) + [float("inf")] * (len(items) - len(scores))
+
+        history = self._split_context(context_str)
+        examples, example_scores = [], []
+        for example, score in zip(question_sql_list, ranked(related.question_sql_scores, question_sql_list)):
+            if example is not None and "question" in example and "sql" in example:
+                examples.append(example)
+                example_scores.append(score)
+
+        # Every section gets its own share of the budget; the most similar chunks are kept first
+        sections = self.prompt_builder.allocate(
+            [
+                PromptSection("history", history, scores=list(range(len(history))), keep_order=True),
+                PromptSection("ddl", ddl_list, scores=ranked(related.ddl_scores, ddl_list)),
+                PromptSection("documentation", doc_list, scores=ranked(related.doc_scores, doc_list)),
+                PromptSection("relations", rel_list, scores=ranked(related.rel_scores, rel_list)),
+                PromptSection(
+                    "examples", examples, scores=example_scores,
+                    render=lambda example: f"{example['question']}\n{example['sql']}",
+                ),
+            ],
+            reserved=self.str_to_approx_token_count(initial_prompt + guidelines + question),
+        )
+
+        parts = [
+            initial_prompt,
+            f"\n\n Previous Questions Context : ****PREVIOUS 3 QUESTIONS ASKED BY USER and SQL queries are**** \n {chr(10).join(sections['history'].rendered)} ==========",
+            f"\n\n  ======**OVERALLN CONTEXT FOR SQL QUERY (given below) : **=======",
+        ]
+        for name, heading in (
+            ("ddl", "\n===Tables \n"),
+            ("documentation", "\n===Additional Context \n\n"),
+            ("relations", "\n=== The relationship between the tables \n\n"),
+        ):
+            if sections[name].rendered:
+                parts.append(heading)
+                parts.extend(f"{text}\n\n" for text in sections[name].rendered)
+        parts.append(guidelines)
+
+        message_log = [self.system_message("".join(parts))]
+
+        for example in sections["examples"].selected:
+            message_log.append(self.user_message(example["question"]))
+            message_log.append(self.assistant_message(example["sql"]))
 
         message_log.append(self.user_message(question))
 
@@ -810,6 +1245,27 @@ class SahdevBase(ABC):
         """
         pass
 
+    async def submit_prompt_async(self, prompt, **kwargs) -> str:
+        """
+        Async version of `submit_prompt`. LLM integrations with a native async client should
+        override it; this default runs the blocking `submit_prompt` in a worker thread.
+        """
+        return await asyncio.to_thread(self.submit_prompt, prompt, **kwargs)
+
+    async def submit_prompt_candidates_async(self, prompt, n: int, **kwargs) -> List[str]:
+        """
+        `n` independent completions of `prompt`. This default sends `n` concurrent
+        `submit_prompt_async` calls; LLM integrations that can return several choices from one
+        request should override it.
+        """
+        responses = await asyncio.gather(
+            *(self.submit_prompt_async(prompt, **kwargs) for _ in range(n)), return_exceptions=True
+        )
+        completions = [response for response in responses if isinstance(response, str)]
+        if not completions and responses:
+            raise responses[0]
+        return completions
+
     def generate_question(self, sql: str, **kwargs) -> str:
         response = self.submit_prompt(
             [
@@ -879,16 +1335,34 @@ class SahdevBase(ABC):
         engine = create_engine(connection_url, **kwargs)
 
         def run_sql_mssql(sql: str):
-            # Execute the SQL statement and return the result as a pandas DataFrame
+            # Execute the SQL statement and return the result as a pandas DataFrame,
+            # fetched in chunks and capped at the configured row/byte ceilings
+            cache = self.query_cache
+            if cache is not None:
+                df = cache.get(sql)
+                if df is not None:
+                    self.log(title="Query cache hit", message=f"{len(df)} rows")
+                    return df
+
+            fetcher = self.result_fetcher
             with engine.begin() as conn:
-                df = pd.read_sql_query(sa.text(sql), conn)
-                conn.close()
+                df = fetcher.fetch(conn, sa.text(fetcher.prepare(sql)))
+                if df.attrs.get("truncated"):
+                    self.log(title="Result truncated", message=f"Stopped at {len(df)} rows")
+                if cache is not None:
+                    cache.set(sql, df)
                 return df
 
             raise Exception("Couldn't run sql")
 
+        def validate_sql_mssql(sql: str):
+            # Compiles the query and describes its result set without executing it
+            with engine.connect() as conn:
+                conn.execute(sa.text("EXEC sp_describe_first_result_set @tsql = :tsql"), {"tsql": sql}).fetchall()
+
         self.dialect = "Microsoft SQL Server / SSMS"
         self.run_sql = run_sql_mssql
+        self.validate_sql = validate_sql_mssql
         self.run_sql_is_set = True
     
 
@@ -0,0 +1 @@
+from .embedding_service import EmbeddingService, get_embedding_service
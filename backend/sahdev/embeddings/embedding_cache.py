@@ -0,0 +1,85 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+_whitespace_re = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Folds case and whitespace so "Top 5  customers " and "top 5 customers" share a key.
+    MiniLM lower-cases its input anyway, so the embedding of the normalized text is the same.
+    """
+    return _whitespace_re.sub(" ", text).strip().casefold()
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of embeddings keyed on normalized text, with an optional
+    on-disk tier (diskcache) that survives restarts and is shared between workers.
+    """
+
+    def __init__(self, max_entries: int = 10000, disk_dir: Optional[str] = None, disk_size_limit: int = 2 ** 30):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.disk = None
+        if disk_dir:
+            from diskcache import Cache
+
+            self.disk = Cache(disk_dir, size_limit=disk_size_limit, eviction_policy="least-recently-used")
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+
+        if self.disk is not None:
+            embedding = self.disk.get(key)
+            if embedding is not None:
+                self._put(key, embedding)
+                with self._lock:
+                    self.disk_hits += 1
+                return embedding
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, embedding: List[float]):
+        self._put(key, embedding)
+        if self.disk is not None:
+            self.disk.set(key, embedding)
+
+    def _put(self, key: str, embedding: List[float]):
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,219 @@
+"""
+Process-wide sentence embedding service.
+
+Every caller that needs a MiniLM vector (the PGVector training collections and the
+persona question suggestions) goes through `get_embedding_service()`, so a worker
+holds exactly one copy of the model.
+
+Environment variables:
+
+| Variable | Default | Meaning |
+| --- | --- | --- |
+| `EMBEDDING_MODEL` | `sentence-transformers/all-MiniLM-l6-v2` | SentenceTransformer model name |
+| `EMBEDDING_BACKEND` | `torch` | `torch` or `onnx` |
+| `EMBEDDING_QUANTIZE` | `false` | int8 inference (dynamic quantization for torch, quantized model file for onnx) |
+| `EMBEDDING_ONNX_FILE` | `onnx/model_quint8_avx2.onnx` | ONNX file used when `EMBEDDING_BACKEND=onnx` and quantization is on |
+| `EMBEDDING_BATCH_SIZE` | `64` | Batch size used by `embed_many` and `embed_documents` |
+| `EMBEDDING_CACHE_SIZE` | `10000` | Entries kept in the in-memory LRU cache of query embeddings (0 disables it) |
+| `EMBEDDING_CACHE_DIR` | unset | If set, an on-disk cache tier shared by all workers |
+| `EMBEDDING_SOCKET` | unset | If set, do not load a model; ask the shared model server on this unix socket instead |
+| `EMBEDDING_SOCKET_AUTHKEY` | `sahdev-embeddings` | Auth key shared by the model server and its clients |
+
+Start the shared model server once per container with
+`python -m backend.sahdev.embeddings.server` and point the workers at it with `EMBEDDING_SOCKET`.
+"""
+
+import os
+import threading
+from multiprocessing.connection import Client
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from ..exceptions import ConnectionError, DependencyError
+from .embedding_cache import EmbeddingCache, normalize_text
+
+DEFAULT_MODEL_NAME = "sentence-transformers/all-MiniLM-l6-v2"
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "false").lower() in ("1", "true", "yes")
+
+
+class LocalEmbeddingModel:
+    """
+    Loads the SentenceTransformer model in this process, on first use.
+    """
+
+    def __init__(self, model_name: str, backend: str = "torch", quantize: bool = False):
+        self.model_name = model_name
+        self.backend = backend
+        self.quantize = quantize
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise DependencyError(
+                "You need to install required dependencies to execute this method,"
+                " run command: pip install sentence-transformers"
+            )
+
+        if self.backend == "onnx":
+            model_kwargs = {}
+            if self.quantize:
+                model_kwargs["file_name"] = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+            print(f"Loading embedding model {self.model_name} (onnx, quantized={self.quantize})")
+            return SentenceTransformer(self.model_name, backend="onnx", model_kwargs=model_kwargs)
+
+        print(f"Loading embedding model {self.model_name} (torch, quantized={self.quantize})")
+        model = SentenceTransformer(self.model_name, device="cpu")
+        if self.quantize:
+            import torch
+
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def encode(self, texts: List[str], batch_size: int) -> List[List[float]]:
+        return self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True).tolist()
+
+
+class RemoteEmbeddingModel:
+    """
+    Talks to the shared model server (`backend.sahdev.embeddings.server`) over a local socket,
+    so several uvicorn workers can share one loaded model.
+    """
+
+    def __init__(self, address: str, authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+            self._local.conn = conn
+        return conn
+
+    def encode(self, texts: List[str], batch_size: int) -> List[List[float]]:
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+                conn.send({"texts": texts, "batch_size": batch_size})
+                response = conn.recv()
+                break
+            except (EOFError, OSError) as e:
+                # The server may have restarted; reconnect once before giving up
+                self._local.conn = None
+                if attempt == 1:
+                    raise ConnectionError(f"Embedding server at {self.address} is unreachable: {e}")
+
+        if "error" in response:
+            raise RuntimeError(f"Embedding server error: {response['error']}")
+        return response["embeddings"]
+
+
+class EmbeddingService(Embeddings):
+    """
+    The single embedding entry point of a process. It is a langchain `Embeddings`, so it can be
+    handed to `PGVector` directly. Queries (`embed_query`, `embed`, `embed_many`) are normalized
+    and cached; documents (`embed_documents`) are embedded as they are.
+    """
+
+    def __init__(self, model, batch_size: int = 64, cache: Optional[EmbeddingCache] = None):
+        self.model = model
+        self.batch_size = batch_size
+        self.cache = cache
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingService":
+        batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+        cache_size = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+        cache = EmbeddingCache(cache_size, disk_dir=os.getenv("EMBEDDING_CACHE_DIR")) if cache_size > 0 else None
+
+        socket_path = os.getenv("EMBEDDING_SOCKET")
+        if socket_path:
+            authkey = os.getenv("EMBEDDING_SOCKET_AUTHKEY", "sahdev-embeddings").encode()
+            return cls(RemoteEmbeddingModel(socket_path, authkey), batch_size=batch_size, cache=cache)
+
+        model = LocalEmbeddingModel(
+            model_name=os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL_NAME),
+            backend=os.getenv("EMBEDDING_BACKEND", "torch").lower(),
+            quantize=_env_flag("EMBEDDING_QUANTIZE"),
+        )
+        return cls(model, batch_size=batch_size, cache=cache)
+
+    def embed_many(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        """
+        Embeds a list of query texts, `batch_size` texts per forward pass. Texts are normalized
+        (case and whitespace folded) and looked up in the embedding cache first, so only
+        the distinct misses reach the model.
+        """
+        if not texts:
+            return []
+
+        keys = [normalize_text(text) for text in texts]
+        if self.cache is None:
+            return self.model.encode(keys, batch_size or self.batch_size)
+
+        embeddings = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            embedding = self.cache.get(key)
+            if embedding is None:
+                missing.append(key)
+            else:
+                embeddings[key] = embedding
+
+        if missing:
+            for key, embedding in zip(missing, self.model.encode(missing, batch_size or self.batch_size)):
+                self.cache.set(key, embedding)
+                embeddings[key] = embedding
+
+        return [embeddings[key] for key in keys]
+
+    def cache_stats(self) -> dict:
+        return self.cache.stats() if self.cache is not None else {}
+
+    def embed(self, text: str) -> List[float]:
+        return self.embed_many([text])[0]
+
+    # langchain Embeddings interface
+    def embed_documents(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        # Stored documents (DDL, SQL, suggestions) are embedded verbatim and never cached:
+        # folding case would change case-sensitive text, and one-off documents would only
+        # push hot query entries out of the cache
+        if not texts:
+            return []
+        return self.model.encode(list(texts), batch_size or self.batch_size)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed(text)
+
+
+_service: Optional[EmbeddingService] = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """
+    Returns the process-wide `EmbeddingService`, creating it on first call.
+    The model itself is only loaded when the first text is embedded.
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EmbeddingService.from_env()
+    return _service
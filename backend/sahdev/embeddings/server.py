@@ -0,0 +1,56 @@
+"""
+Shared embedding model server.
+
+Loads one model and serves every uvicorn worker of the container over a unix socket:
+
+    EMBEDDING_SOCKET=/tmp/sahdev-embeddings.sock python -m backend.sahdev.embeddings.server
+
+Workers started with the same `EMBEDDING_SOCKET` (and `EMBEDDING_SOCKET_AUTHKEY`) then
+skip loading the model themselves.
+"""
+
+import os
+import threading
+from multiprocessing.connection import Listener
+
+from .embedding_service import DEFAULT_MODEL_NAME, LocalEmbeddingModel, _env_flag
+
+
+def _serve_connection(conn, model: LocalEmbeddingModel):
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                return
+            try:
+                embeddings = model.encode(request["texts"], request.get("batch_size", 64))
+                conn.send({"embeddings": embeddings})
+            except Exception as e:
+                conn.send({"error": str(e)})
+
+
+def serve(address: str, authkey: bytes):
+    model = LocalEmbeddingModel(
+        model_name=os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL_NAME),
+        backend=os.getenv("EMBEDDING_BACKEND", "torch").lower(),
+        quantize=_env_flag("EMBEDDING_QUANTIZE"),
+    )
+    # Load eagerly so the first worker request does not pay for it
+    model.model
+
+    if os.path.exists(address):
+        os.remove(address)
+
+    with Listener(address, family="AF_UNIX", authkey=authkey) as listener:
+        print(f"Embedding server listening on {address}")
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_serve_connection, args=(conn, model), daemon=True).start()
+
+
+if __name__ == "__main__":
+    serve(
+        os.getenv("EMBEDDING_SOCKET", "/tmp/sahdev-embeddings.sock"),
+        os.getenv("EMBEDDING_SOCKET_AUTHKEY", "sahdev-embeddings").encode(),
+    )
@@ -6,9 +6,12 @@ from ..base import SahdevBase
 
 
 class OpenAI_Chat(SahdevBase):
-    def __init__(self, client=None, config=None):
+    def __init__(self, client=None, config=None, async_client=None):
         SahdevBase.__init__(self, config=config)
 
+        # Optional AsyncOpenAI / AsyncAzureOpenAI client used by submit_prompt_async
+        self.async_client = async_client
+
         # default parameters - can be overrided using config
         self.temperature = 0.2
 
@@ -50,7 +53,11 @@ class OpenAI_Chat(SahdevBase):
     def assistant_message(self, message: str) -> any:
         return {"role": "assistant", "content": message}
 
-    def submit_prompt(self, prompt, **kwargs) -> str:
+    def _prompt_request(self, prompt, **kwargs) -> dict:
+        """
+        Validates the prompt and picks the model/engine for it. Returns the keyword
+        arguments for `chat.completions.create`, shared by the sync and async paths.
+        """
         if prompt is None:
             raise Exception("Prompt is None")
 
@@ -68,43 +75,23 @@ class OpenAI_Chat(SahdevBase):
             print(
                 f"Using model {model} for {num_tokens} tokens (approx)"
             )
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=prompt,
-                stop=None,
-                temperature=self.temperature,
-            )
+            target = {"model": model}
         elif kwargs.get("engine", None) is not None:
             engine = kwargs.get("engine", None)
             print(
                 f"Using model {engine} for {num_tokens} tokens (approx)"
             )
-            response = self.client.chat.completions.create(
-                engine=engine,
-                messages=prompt,
-                stop=None,
-                temperature=self.temperature,
-            )
+            target = {"engine": engine}
         elif self.config is not None and "engine" in self.config:
             print(
                 f"Using engine {self.config['engine']} for {num_tokens} tokens (approx)"
             )
-            response = self.client.chat.completions.create(
-                engine=self.config["engine"],
-                messages=prompt,
-                stop=None,
-                temperature=self.temperature,
-            )
+            target = {"engine": self.config["engine"]}
         elif self.config is not None and "model" in self.config:
             print(
                 f"Using model {self.config['model']} for {num_tokens} tokens (approx)"
             )
-            response = self.client.chat.completions.create(
-                model=self.config["model"],
-                messages=prompt,
-                stop=None,
-                temperature=self.temperature,
-            )
+            target = {"model": self.config["model"]}
         else:
             if num_tokens > 3500:
                 #model = "gpt-3.5-turbo-16k"
@@ -113,13 +100,16 @@ class OpenAI_Chat(SahdevBase):
                 model = "gpt-4"
 
             print(f"Using model {model} for {num_tokens} tokens (approx)")
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=prompt,
-                stop=None,
-                temperature=self.temperature,
-            )
+            target = {"model": model}
+
+        return {
+            **target,
+            "messages": prompt,
+            "stop": None,
+            "temperature": self.temperature,
+        }
 
+    def _response_text(self, response) -> str:
         # Find the first response from the chatbot that has text in it (some responses may not have text)
         for choice in response.choices:
             if "text" in choice:
@@ -127,3 +117,27 @@ class OpenAI_Chat(SahdevBase):
 
         # If no response with text is found, return the first response's content (which may be empty)
         return response.choices[0].message.content
+
+    def submit_prompt(self, prompt, **kwargs) -> str:
+        response = self.client.chat.completions.create(**self._prompt_request(prompt, **kwargs))
+        return self._response_text(response)
+
+    async def submit_prompt_async(self, prompt, **kwargs) -> str:
+        if self.async_client is None:
+            return await SahdevBase.submit_prompt_async(self, prompt, **kwargs)
+
+        response = await self.async_client.chat.completions.create(**self._prompt_request(prompt, **kwargs))
+        return self._response_text(response)
+
+    async def submit_prompt_candidates_async(self, prompt, n: int, **kwargs) -> list:
+        """
+        `n` completions of `prompt` from a single request (`n=`), sampled at
+        `speculative_temperature` so that the candidates differ.
+        """
+        if self.async_client is None:
+            return await SahdevBase.submit_prompt_candidates_async(self, prompt, n, **kwargs)
+
+        request = self._prompt_request(prompt, **kwargs)
+        request.update({"n": n, "temperature": max(self.temperature, self.speculative_temperature)})
+        response = await self.async_client.chat.completions.create(**request)
+        return [choice.message.content for choice in response.choices if choice.message.content]
@@ -5,12 +5,15 @@ import pandas as pd
 from typing import List
 from sqlalchemy import create_engine,text
 from sqlalchemy.exc import OperationalError
-from time import sleep
+import psycopg2
+from psycopg2.extras import execute_values
+from time import monotonic, sleep
 from langchain_community.vectorstores import PGVector
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.documents import Document
 from pandas.core.api import DataFrame as DataFrame
 from ...sahdev.base.base import SahdevBase
+from ...sahdev.embeddings import get_embedding_service
+from ...sahdev.types import RelatedTrainingData
 
 
 class PG_VectorStore(SahdevBase):
@@ -23,13 +26,32 @@ class PG_VectorStore(SahdevBase):
 
         self.connection_string = config["connection_string"]
         self.n_results = config.get("n_results", 3)
-        self.embedding_function = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-l6-v2")
+        self.embedding_function = config.get("embedding_function") or get_embedding_service()
         self.ddl_vectorstore = self._initialize_vectorstore("ddl_statements")
         self.documentation_vectorstore = self._initialize_vectorstore("documentation")
         self.sql_vectorstore = self._initialize_vectorstore("question_sql_pairs")
         self.relations_vectorstore = self._initialize_vectorstore("relations")
 
+        # Collection name -> RelatedTrainingData field prefix, in the order they are queried
+        self.related_collections = {
+            "question_sql_pairs": "question_sql",
+            "ddl_statements": "ddl",
+            "documentation": "doc",
+            "relations": "rel",
+        }
+        # add_many kind -> (collection name, id suffix)
+        self.bulk_collections = {
+            "ddl": ("ddl_statements", "-ddl"),
+            "documentation": ("documentation", "-doc"),
+            "relations": ("relations", "-rel"),
+            "sql": ("question_sql_pairs", "-sql"),
+        }
+
+        # Training data generation, memoized for training_generation_ttl seconds
+        self.training_generation_ttl = config.get("training_generation_ttl", 60)
+        self._training_generation = None
+        self._training_generation_at = 0.0
+
         # Initialize the SQLAlchemy engine
         self.engine = self._create_engine_with_retries()
 
@@ -56,12 +78,13 @@ class PG_VectorStore(SahdevBase):
 
     def _retry_query(self, query_func, retries=3, delay=2, *args, **kwargs):
         """
-        Helper method to retry queries in case of connection issues.
+        Helper method to retry queries in case of connection issues, raised by SQLAlchemy
+        or by psycopg2 directly on raw connections.
         """
         for attempt in range(retries):
             try:
                 return query_func(*args, **kwargs)
-            except OperationalError as e:
+            except (OperationalError, psycopg2.OperationalError) as e:
                 if attempt < retries - 1:
                     print(f"Retrying query after error: {e}. Attempt {attempt + 1}")
                     sleep(delay)  # Wait before retrying
@@ -78,6 +101,7 @@ class PG_VectorStore(SahdevBase):
             self.sql_vectorstore.add_documents([doc], ids=doc.metadata["id"])
 
         self._retry_query(add_doc)
+        self._training_generation = None
 
         return id
 
@@ -89,6 +113,7 @@ class PG_VectorStore(SahdevBase):
             self.relations_vectorstore.add_documents([doc], ids=doc.metadata["id"])
 
         self._retry_query(add_doc)
+        self._training_generation = None
         return id
 
     def add_ddl(self, ddl: str, **kwargs) -> str:
@@ -99,6 +124,7 @@ class PG_VectorStore(SahdevBase):
             self.ddl_vectorstore.add_documents([doc], ids=doc.metadata["id"])
 
         self._retry_query(add_doc)
+        self._training_generation = None
         return id
 
     def add_documentation(self, documentation: str, **kwargs) -> str:
@@ -109,8 +135,82 @@ class PG_VectorStore(SahdevBase):
             self.documentation_vectorstore.add_documents([doc], ids=doc.metadata["id"])
 
         self._retry_query(add_doc)
+        self._training_generation = None
         return id
 
+    def add_many(self, kind: str, items: list, batch_size: int = 256, **kwargs) -> List[str]:
+        """
+        Adds many items of one kind of training data, `batch_size` at a time: one embedding
+        call and one multi-row INSERT into langchain_pg_embedding per batch, instead of a
+        PGVector.add_documents round trip per item. Prints progress and throughput per batch.
+        """
+        if kind not in self.bulk_collections:
+            return super().add_many(kind, items, batch_size=batch_size, **kwargs)
+        collection_name, suffix = self.bulk_collections[kind]
+
+        if kind == "sql":
+            pairs = [(item["question"], item["sql"]) if isinstance(item, dict) else tuple(item) for item in items]
+            documents = [json.dumps({"question": question, "sql": sql}, ensure_ascii=False) for question, sql in pairs]
+        else:
+            documents = list(items)
+        ids = [str(uuid.uuid4()) + suffix for _ in documents]
+        if not documents:
+            return ids
+
+        def fetch_collection_id():
+            with self.engine.connect() as connection:
+                return connection.execute(
+                    text("SELECT uuid FROM langchain_pg_collection WHERE name = :name"), {"name": collection_name}
+                ).scalar()
+
+        collection_id = self._retry_query(fetch_collection_id)
+        if collection_id is None:
+            raise ValueError(f"Collection {collection_name} does not exist")
+
+        def insert_batch(rows):
+            connection = self.engine.raw_connection()
+            try:
+                with connection.cursor() as cursor:
+                    execute_values(
+                        cursor,
+                        """
+                        INSERT INTO langchain_pg_embedding (uuid, collection_id, embedding, document, cmetadata, custom_id)
+                        VALUES %s
+                        """,
+                        rows,
+                        template="(%s, %s, %s::vector, %s, %s, %s)",
+                        page_size=len(rows),
+                    )
+                connection.commit()
+            except psycopg2.OperationalError:
+                # Do not hand a broken connection back to the pool for the retry to pick up
+                connection.invalidate()
+                raise
+            finally:
+                connection.close()
+
+        started = monotonic()
+        try:
+            for offset in range(0, len(documents), batch_size):
+                batch = documents[offset:offset + batch_size]
+                batch_ids = ids[offset:offset + batch_size]
+                embeddings = self.embedding_function.embed_documents(batch)
+
+                rows = [
+                    (str(uuid.uuid4()), str(collection_id), "[" + ",".join(str(float(value)) for value in embedding) + "]",
+                     document, json.dumps({"id": id}), id)
+                    for document, embedding, id in zip(batch, embeddings, batch_ids)
+                ]
+                self._retry_query(insert_batch, rows=rows)
+
+                done = offset + len(batch)
+                elapsed = monotonic() - started
+                print(f"Added {done}/{len(documents)} {kind} items to {collection_name} ({done / elapsed if elapsed else 0:.1f} items/s)")
+        finally:
+            self._training_generation = None
+
+        return ids
+
     def get_similar_question_sql(self, question: str, **kwargs) -> list:
         def fetch_similar():
             return self.sql_vectorstore.similarity_search(question, k=self.n_results)
@@ -135,6 +235,67 @@ class PG_VectorStore(SahdevBase):
 
         return [doc.page_content for doc in self._retry_query(fetch_similar)]
 
+    def get_related_training_data(self, question: str, **kwargs) -> RelatedTrainingData:
+        """
+        Embeds the question once and fetches the top `n_results` rows of every
+        collection with a single UNION ALL statement, instead of one
+        `similarity_search` (and one embedding) per collection.
+        """
+        embedding = self.embedding_function.embed_query(question)
+        embedding_str = "[" + ",".join(map(str, embedding)) + "]"
+
+        selects = []
+        params = {"embedding": embedding_str, "k": self.n_results}
+        for i, collection_name in enumerate(self.related_collections):
+            params[f"collection_{i}"] = collection_name
+            selects.append(f"""
+                (SELECT c.name AS collection_name, e.document,
+                        e.embedding <=> CAST(:embedding AS vector) AS distance
+                 FROM langchain_pg_embedding e
+                 JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+                 WHERE c.name = :collection_{i}
+                 ORDER BY distance
+                 LIMIT :k)""")
+        query = text(" UNION ALL ".join(selects) + " ORDER BY collection_name, distance")
+
+        def fetch_related():
+            with self.engine.connect() as connection:
+                return connection.execute(query, params).fetchall()
+
+        related = RelatedTrainingData()
+        for collection_name, document, distance in self._retry_query(fetch_related):
+            prefix = self.related_collections[collection_name]
+            if prefix == "question_sql":
+                try:
+                    document = ast.literal_eval(document)
+                except (ValueError, SyntaxError):
+                    print(f"Skipping question-SQL pair that could not be parsed: {document[:80]}")
+                    continue
+            getattr(related, f"{prefix}_list").append(document)
+            getattr(related, f"{prefix}_scores").append(1 - float(distance))
+
+        return related
+
+    def get_training_generation(self, **kwargs) -> str:
+        """
+        Hash of the ids of every stored training row. Any add or remove, from this
+        process or another one, changes it within `training_generation_ttl` seconds.
+        """
+        if self._training_generation is None or monotonic() - self._training_generation_at > self.training_generation_ttl:
+            query = text("""
+                SELECT md5(coalesce(string_agg(cmetadata ->> 'id', ',' ORDER BY cmetadata ->> 'id'), ''))
+                FROM langchain_pg_embedding
+            """)
+
+            def fetch_generation():
+                with self.engine.connect() as connection:
+                    return connection.execute(query).scalar()
+
+            self._training_generation = self._retry_query(fetch_generation)
+            self._training_generation_at = monotonic()
+
+        return self._training_generation
+
     def get_training_data(self, **kwargs) -> DataFrame:
         query_embedding = "SELECT cmetadata, document FROM langchain_pg_embedding"
 
@@ -200,6 +361,7 @@ class PG_VectorStore(SahdevBase):
                         delete_statement, {'id': id})
                     # Commit the transaction if the delete was successful
                     transaction.commit()
+                    self._training_generation = None
                     # Check if any row was deleted and return True or False accordingly
                     return result.rowcount > 0
                 except Exception as e:
@@ -232,6 +394,7 @@ class PG_VectorStore(SahdevBase):
                 try:
                     result = connection.execute(query)
                     transaction.commit()  # Explicitly commit the transaction
+                    self._training_generation = None
                     if result.rowcount > 0:
                         print(
                             f"Deleted {result.rowcount} rows from langchain_pg_embedding where collection is {collection_name}.")
@@ -246,7 +409,7 @@ class PG_VectorStore(SahdevBase):
                     return False
 
     def generate_embedding(self, data: str, **kwargs) -> List[float]:
-        pass
+        return self.embedding_function.embed_query(data)
 
 
 
@@ -0,0 +1,142 @@
+import functools
+import math
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+# Share of the retrieved-context budget each section may spend before any spare tokens are handed out
+DEFAULT_SECTION_BUDGETS = {
+    "history": 0.15,
+    "ddl": 0.40,
+    "relations": 0.10,
+    "documentation": 0.15,
+    "examples": 0.20,
+}
+
+# Spare tokens left by one section go to the others in this order
+SECTION_PRIORITY = ["ddl", "relations", "examples", "documentation", "history"]
+
+
+@functools.lru_cache(maxsize=8)
+def get_encoder(model: str = "gpt-4"):
+    """
+    Returns the tiktoken encoding for `model` (cl100k_base for unknown models), loaded once
+    per process, or None when tiktoken is not installed.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """
+    Number of tokens in `text` for `model`; falls back to len/4 without tiktoken.
+    """
+    if not text:
+        return 0
+    encoder = get_encoder(model)
+    if encoder is None:
+        return math.ceil(len(text) / 4)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+@dataclass
+class PromptSection:
+    """
+    One retrieved section of a prompt. `items` are ranked by `scores` (highest first) when
+    scores are given and kept in their retrieval order otherwise. With `keep_order` the
+    selected items are emitted in their original order (conversation history), else in rank order.
+    """
+    name: str
+    items: List
+    scores: Optional[List[float]] = None
+    render: Callable = str
+    keep_order: bool = False
+    selected: List = field(default_factory=list)
+    rendered: List[str] = field(default_factory=list)
+    tokens: int = 0
+
+
+class PromptBuilder:
+    """
+    Fits retrieved context into a token budget.
+
+    The budget left after the fixed parts of the prompt is split between sections by
+    `budgets` (fractions). Each section first takes its best-ranked items that fit in its own
+    share, then the tokens nobody used are offered to the sections in SECTION_PRIORITY order.
+    Every item is tokenized once, so the cost is linear in the retrieved context.
+
+    Example:
+    ```python
+    builder = PromptBuilder(max_tokens=14000, model="gpt-4")
+    sections = builder.allocate(
+        [
+            PromptSection("ddl", ddl_list, scores=ddl_scores),
+            PromptSection("documentation", doc_list, scores=doc_scores),
+        ],
+        reserved=builder.count(header) + builder.count(question),
+    )
+    ```
+    """
+
+    def __init__(self, max_tokens: int = 14000, model: str = "gpt-4", budgets: Optional[Dict[str, float]] = None):
+        self.max_tokens = max_tokens
+        self.model = model
+        self.budgets = budgets or DEFAULT_SECTION_BUDGETS
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def allocate(self, sections: List[PromptSection], reserved: int = 0) -> Dict[str, PromptSection]:
+        available = max(self.max_tokens - reserved, 0)
+        by_name = {section.name: section for section in sections}
+        total_share = sum(self.budgets.get(section.name, 0) for section in sections) or 1
+
+        candidates = {}
+        for section in sections:
+            scores = section.scores or []
+            order = list(range(len(section.items)))
+            if scores:
+                # Stable sort: equal scores keep their retrieval order; unscored items go last
+                order.sort(key=lambda position: scores[position] if position < len(scores) else float("-inf"), reverse=True)
+            candidates[section.name] = []
+            for position in order:
+                text = section.render(section.items[position])
+                candidates[section.name].append((position, text, self.count(text)))
+
+        chosen = {section.name: set() for section in sections}
+        spent = {section.name: 0 for section in sections}
+
+        def take(name: str, budget: int) -> int:
+            # Best-ranked first; an item that does not fit is skipped, smaller ones may still fit
+            for position, _, tokens in candidates[name]:
+                if position in chosen[name] or tokens > budget:
+                    continue
+                chosen[name].add(position)
+                spent[name] += tokens
+                budget -= tokens
+            return budget
+
+        spare = 0
+        for section in sections:
+            share = int(available * self.budgets.get(section.name, 0) / total_share)
+            spare += take(section.name, share)
+
+        for name in dict.fromkeys(SECTION_PRIORITY + [section.name for section in sections]):
+            if name in by_name and spare > 0:
+                spare = take(name, spare)
+
+        for section in sections:
+            rank = {position: index for index, (position, _, _) in enumerate(candidates[section.name])}
+            positions = sorted(chosen[section.name], key=(lambda p: p) if section.keep_order else rank.get)
+            rendered = {position: text for position, text, _ in candidates[section.name]}
+            section.selected = [section.items[position] for position in positions]
+            section.rendered = [rendered[position] for position in positions]
+            section.tokens = spent[section.name]
+
+        return by_name
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+except ImportError:
+    sqlglot = None
+
+# Results of queries calling these functions change from one run to the next
+_volatile_functions = {"getdate", "getutcdate", "sysdatetime", "sysutcdatetime", "sysdatetimeoffset", "newid", "rand", "current_timestamp"}
+_volatile_expressions = ("CurrentTimestamp", "CurrentDate", "CurrentTime", "Rand")
+
+
+def canonicalize_sql(sql: str, dialect: str = "tsql") -> Optional[Tuple[str, List[str]]]:
+    """
+    Returns the canonical text of `sql` and the tables it reads, or None when it cannot be
+    parsed or must not be cached (not a single query, or calls a volatile function).
+
+    The canonical text ignores whitespace, keyword and identifier case and quoting, the names of table,
+    subquery and CTE aliases (renamed __t0, __t1, ... in order of appearance) and the order of AND / OR operands
+    and of IN lists, so equivalent queries written differently share one cache entry.
+    """
+    if sqlglot is None:
+        return None
+    try:
+        statements = [statement for statement in sqlglot.parse(sql, read=dialect) if statement is not None]
+    except sqlglot.errors.SqlglotError:
+        return None
+    if len(statements) != 1 or not isinstance(statements[0], exp.Query):
+        return None
+
+    query = normalize_identifiers(statements[0], dialect=dialect)
+    for function in query.find_all(exp.Func):
+        name = (function.name if isinstance(function, exp.Anonymous) else function.sql_name()).lower()
+        if name in _volatile_functions or type(function).__name__ in _volatile_expressions:
+            return None
+    if any(select.args.get("into") for select in query.find_all(exp.Select)):
+        return None
+
+    cte_names = {cte.alias_or_name for cte in query.find_all(exp.CTE)}
+    tables = sorted({table.name for table in query.find_all(exp.Table) if table.name not in cte_names})
+    if not tables:
+        return None
+
+    # The canonical text is only hashed, never run, so [Region] and Region can share it
+    for identifier in query.find_all(exp.Identifier):
+        identifier.set("quoted", False)
+
+    # Rename every table, derived table and CTE alias in order of appearance. The "__t" prefix cannot
+    # collide with an alias the query already uses, so distinct aliases never merge into one name
+    aliases = {}
+    for table_alias in list(query.find_all(exp.TableAlias)):
+        if table_alias.name:
+            aliases.setdefault(table_alias.name, f"__t{len(aliases)}")
+            table_alias.set("this", exp.to_identifier(aliases[table_alias.name]))
+    for table in query.find_all(exp.Table):
+        if table.name in cte_names and not table.db and table.name in aliases:
+            table.set("this", exp.to_identifier(aliases[table.name]))
+    for column in query.find_all(exp.Column):
+        if column.table in aliases:
+            column.set("table", exp.to_identifier(aliases[column.table]))
+
+    def sort_key(node) -> str:
+        return node.sql(dialect=dialect)
+
+    for predicate in list(query.find_all(exp.In)):
+        if predicate.expressions:
+            predicate.set("expressions", sorted(predicate.expressions, key=sort_key))
+    # Whole AND / OR chains, deepest first so that nested chains are sorted before their parents
+    chains = [node for node in query.find_all(exp.And, exp.Or) if not isinstance(node.parent, type(node))]
+    for chain in reversed(chains):
+        operands = sorted(chain.flatten(unnest=False), key=sort_key)
+        combined = operands[0]
+        for operand in operands[1:]:
+            combined = type(chain)(this=combined, expression=operand)
+        chain.replace(combined)
+
+    return query.sql(dialect=dialect, normalize=True), tables
+
+
+class QueryResultCache:
+    """
+    Caches query result DataFrames on disk (diskcache, shared by all workers) under the hash
+    of the canonical SQL, so equivalent queries from different questions and users are
+    answered without the database.
+
+    Every table has a version counter; an entry remembers the versions of the tables it
+    read and is ignored once any of them has moved on, so `invalidate_tables` after a
+    table reload is a counter increment per table. Entries expire after the smallest TTL
+    of their tables (`table_ttls`, else `ttl`); a TTL of 0 disables caching for that table.
+
+    Example:
+    ```python
+    cache = QueryResultCache("/tmp/query_cache", ttl=600, table_ttls={"salesorders": 60})
+    df = cache.get(sql)
+    if df is None:
+        df = run(sql)
+        cache.set(sql, df)
+    cache.invalidate_tables(["SalesOrders"])
+    ```
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        ttl: int = 600,
+        table_ttls: Optional[Dict[str, int]] = None,
+        size_limit: int = 2 ** 29,
+        dialect: str = "tsql",
+    ):
+        from diskcache import Cache
+
+        self.ttl = ttl
+        self.table_ttls = {table.lower(): seconds for table, seconds in (table_ttls or {}).items()}
+        self.dialect = dialect
+        self.entries = Cache(os.path.join(directory, "results"), size_limit=size_limit, eviction_policy="least-recently-used")
+        # Table versions and counters must never be evicted, or an invalidated result could come back
+        self.meta = Cache(os.path.join(directory, "meta"), eviction_policy="none")
+
+    @property
+    def available(self) -> bool:
+        return sqlglot is not None
+
+    def _key(self, sql: str) -> Optional[Tuple[str, List[str]]]:
+        canonical = canonicalize_sql(sql, self.dialect)
+        if canonical is None:
+            return None
+        text, tables = canonical
+        return "result:" + hashlib.sha256(text.encode("utf-8")).hexdigest(), tables
+
+    def _versions(self, tables: List[str]) -> Dict[str, int]:
+        return {table: self.meta.get(("version", table), 0) for table in tables}
+
+    def get(self, sql: str) -> Optional[pd.DataFrame]:
+        key = self._key(sql)
+        if key is None:
+            return None
+        entry_key, tables = key
+
+        entry = self.entries.get(entry_key)
+        if entry is None or entry["versions"] != self._versions(tables):
+            self.meta.incr("stats:misses")
+            return None
+        self.meta.incr("stats:hits")
+        return entry["df"].copy()
+
+    def set(self, sql: str, df: pd.DataFrame) -> bool:
+        key = self._key(sql)
+        if key is None:
+            return False
+        entry_key, tables = key
+
+        ttl = min(self.table_ttls.get(table, self.ttl) for table in tables)
+        if ttl <= 0:
+            return False
+        self.entries.set(
+            entry_key,
+            {"versions": self._versions(tables), "tables": tables, "created": time.time(), "df": df},
+            expire=ttl,
+        )
+        return True
+
+    def invalidate_tables(self, tables: List[str]) -> Dict[str, int]:
+        """
+        Marks every cached result that read one of `tables` as stale. Returns the new versions.
+        """
+        return {table.lower(): self.meta.incr(("version", table.lower())) for table in tables}
+
+    def clear(self) -> int:
+        """Removes every cached result; returns how many there were."""
+        return self.entries.clear()
+
+    def stats(self) -> dict:
+        hits = self.meta.get("stats:hits", 0)
+        misses = self.meta.get("stats:misses", 0)
+        lookups = hits + misses
+        return {
+            "entries": len(self.entries),
+            "size_bytes": self.entries.volume(),
+            "size_limit": self.entries.size_limit,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
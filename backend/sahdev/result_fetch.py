@@ -0,0 +1,110 @@
+import re
+from typing import Iterator
+
+import pandas as pd
+
+_leading_comments_re = re.compile(r"^\s*(?:(?:--[^\n]*\n)|(?:/\*.*?\*/)|\s)*", re.DOTALL)
+_select_head_re = re.compile(r"^SELECT(\s+(?:ALL|DISTINCT))?\s+", re.IGNORECASE)
+_has_top_re = re.compile(r"^SELECT(\s+(?:ALL|DISTINCT))?\s+TOP\b", re.IGNORECASE)
+_set_operation_re = re.compile(r"\b(?:UNION|INTERSECT|EXCEPT)\b|\bOFFSET\s+\d+\s+ROWS\b|\bINTO\b", re.IGNORECASE)
+
+
+def inject_top(sql: str, n: int) -> str:
+    """
+    Adds `TOP (n)` to a plain T-SQL `SELECT` that has no row limit of its own.
+
+    Statements that are not a single leading SELECT (CTEs, set operations,
+    OFFSET/FETCH paging, SELECT ... INTO) are returned unchanged; the fetcher's
+    row cap still applies to them.
+    """
+    body = sql[_leading_comments_re.match(sql).end():]
+    if not _select_head_re.match(body) or _has_top_re.match(body) or _set_operation_re.search(body):
+        return sql
+
+    head = _select_head_re.match(body)
+    return sql[: len(sql) - len(body)] + head.group(0) + f"TOP ({int(n)}) " + body[head.end():]
+
+
+class BoundedResultFetcher:
+    """
+    Fetches the result of a query in chunks and stops at a row or byte ceiling,
+    instead of materializing an unbounded result set.
+
+    The returned DataFrame carries `df.attrs["truncated"]` (True when rows were
+    dropped) and `df.attrs["row_limit"]`.
+    """
+
+    def __init__(
+        self,
+        max_rows: int = 5000,
+        max_bytes: int = 50 * 1024 * 1024,
+        chunk_size: int = 1000,
+        add_top: bool = True,
+    ):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.add_top = add_top
+
+    def prepare(self, sql: str) -> str:
+        # Ask for one extra row so a result of exactly max_rows is not reported as truncated
+        return inject_top(sql, self.max_rows + 1) if self.add_top else sql
+
+    def iter_chunks(self, result, state: dict) -> Iterator[pd.DataFrame]:
+        """
+        Yields DataFrames of at most `chunk_size` rows from an open SQLAlchemy result,
+        stopping at the ceilings. `state["truncated"]` is set once the iteration ends
+        (the fetcher itself holds no per-query state, so it can be shared between threads).
+        """
+        columns = list(result.keys())
+        rows_seen = 0
+        bytes_seen = 0
+        truncated = False
+
+        while True:
+            rows = result.fetchmany(self.chunk_size)
+            if not rows:
+                break
+
+            if rows_seen + len(rows) > self.max_rows:
+                rows = rows[: self.max_rows - rows_seen]
+                truncated = True
+
+            chunk = pd.DataFrame.from_records([tuple(row) for row in rows], columns=columns, coerce_float=True)
+            rows_seen += len(chunk)
+            bytes_seen += int(chunk.memory_usage(deep=True).sum())
+            yield chunk
+
+            if truncated:
+                break
+            if bytes_seen >= self.max_bytes:
+                truncated = bool(result.fetchmany(1))
+                break
+
+        state["truncated"] = truncated
+        if truncated:
+            # Stop the server from sending the rest of the result
+            cursor = getattr(result, "cursor", None)
+            if cursor is not None and hasattr(cursor, "cancel"):
+                try:
+                    cursor.cancel()
+                except Exception:
+                    pass
+        result.close()
+
+    def fetch(self, conn, statement) -> pd.DataFrame:
+        """
+        Executes `statement` on `conn` (a SQLAlchemy connection) and returns the bounded result.
+        """
+        result = conn.execution_options(stream_results=True, max_row_buffer=self.chunk_size).execute(statement)
+        if not result.returns_rows:
+            result.close()
+            return pd.DataFrame()
+
+        columns = list(result.keys())
+        state = {}
+        chunks = list(self.iter_chunks(result, state))
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+        df.attrs["truncated"] = state["truncated"]
+        df.attrs["row_limit"] = self.max_rows
+        return df
@@ -0,0 +1,275 @@
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# A plain identifier, or a [bracketed] / "quoted" / `quoted` one that may contain spaces
+_identifier = r"(?:\[[^\]]+\]|\"[^\"]+\"|`[^`]+`|\w+)"
+_qualified_name = rf"(?:{_identifier}\s*\.\s*)*{_identifier}"
+_create_table_re = re.compile(rf"CREATE\s+TABLE\s+({_qualified_name})\s*\(", re.IGNORECASE)
+_identifier_re = re.compile(r"\[([^\]]+)\]|\"([^\"]+)\"|`([^`]+)`|(\w+)")
+_references_re = re.compile(rf"REFERENCES\s+({_qualified_name})\s*\(\s*([^)]*)\)", re.IGNORECASE)
+_foreign_key_re = re.compile(r"FOREIGN\s+KEY\s*\(\s*([^)]*)\)", re.IGNORECASE)
+_primary_key_re = re.compile(r"PRIMARY\s+KEY\s*(?:CLUSTERED|NONCLUSTERED)?\s*\(\s*([^)]*)\)", re.IGNORECASE)
+# table.column or schema.table.column
+_qualified_column_re = re.compile(rf"((?:{_identifier}\.)+)({_identifier})")
+_from_join_re = re.compile(rf"\b(?:FROM|JOIN)\s+({_qualified_name})", re.IGNORECASE)
+_word_re = re.compile(r"[a-z0-9]+")
+_constraint_starts = ("constraint", "primary", "foreign", "unique", "check", "index", "key")
+
+
+def _identifiers(text: str) -> List[str]:
+    """The unquoted identifiers of `text`: `[dbo].[Sales Orders]` -> ["dbo", "Sales Orders"]."""
+    return [next(group for group in match.groups() if group is not None) for match in _identifier_re.finditer(text)]
+
+
+def table_key(name: str) -> str:
+    """`[dbo].[Sales Orders]` -> `sales orders`: the unqualified, unquoted, lower-cased table name."""
+    parts = _identifiers(name)
+    return parts[-1].lower() if parts else name.strip().lower()
+
+
+def _column_names(text: str) -> List[str]:
+    return [column.lower() for column in _identifiers(text)]
+
+
+def quote_identifier(name: str) -> str:
+    """Brackets names that are not plain identifiers, e.g. `Order Date` -> `[Order Date]`."""
+    return name if re.fullmatch(r"\w+", name) else f"[{name}]"
+
+
+def _words(text: str) -> Set[str]:
+    # Split snake_case and CamelCase identifiers as well as prose
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    return {word for word in _word_re.findall(text.lower().replace("_", " ")) if len(word) > 2}
+
+
+def _split_top_level(body: str) -> List[str]:
+    parts, depth, current = [], 0, []
+    for char in body:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    if "".join(current).strip():
+        parts.append("".join(current).strip())
+    return parts
+
+
+@dataclass
+class TableSchema:
+    name: str
+    columns: Dict[str, str] = field(default_factory=dict)  # column key -> column definition
+    primary_key: Set[str] = field(default_factory=set)
+
+
+class SchemaGraph:
+    """
+    Tables as nodes and foreign keys / documented relationships as edges, built from the
+    DDL and relations training data.
+
+    For the tables retrieved for a question, `connect` finds a small connected subgraph
+    (a shortest-path Steiner tree approximation), and `render` emits DDL for just those
+    tables, trimmed to the columns that matter: keys, join columns, and columns the
+    question or the retrieved example SQL mention.
+
+    Example:
+    ```python
+    graph = SchemaGraph.from_training_data(ddl_list, relations_list)
+    tables = graph.connect(graph.tables_defined_in(related.ddl_list))
+    ddl = graph.render(tables, question)
+    ```
+    """
+
+    def __init__(self):
+        self.tables: Dict[str, TableSchema] = {}
+        # table -> neighbour table -> set of (column, neighbour column)
+        self.edges: Dict[str, Dict[str, Set[Tuple[str, str]]]] = {}
+
+    @classmethod
+    def from_training_data(cls, ddl_list: Iterable[str], relations_list: Iterable[str] = ()) -> "SchemaGraph":
+        graph = cls()
+        pending_references = []
+        for ddl in ddl_list:
+            pending_references.extend(graph.add_ddl(ddl))
+        # Foreign keys may point at tables defined later on
+        for table, column, ref_table, ref_column in pending_references:
+            graph.add_edge(table, column, ref_table, ref_column)
+        for relations in relations_list:
+            graph.add_relations(relations)
+        return graph
+
+    def add_ddl(self, ddl: str) -> List[Tuple[str, str, str, str]]:
+        """Parses every CREATE TABLE in `ddl`; returns the foreign keys found as (table, column, ref table, ref column)."""
+        references = []
+        for match in _create_table_re.finditer(ddl):
+            start = match.end()
+            depth, end = 1, start
+            while end < len(ddl) and depth:
+                depth += {"(": 1, ")": -1}.get(ddl[end], 0)
+                end += 1
+
+            table = TableSchema(name=_identifiers(match.group(1))[-1])
+            key = table_key(match.group(1))
+            for definition in _split_top_level(ddl[start:end - 1]):
+                first_word = definition.split(None, 1)[0].lower() if definition.split() else ""
+                # A quoted first word is always a column name, even [Key] or [Primary Key]
+                if first_word in _constraint_starts:
+                    primary_key = _primary_key_re.search(definition)
+                    if primary_key:
+                        table.primary_key.update(_column_names(primary_key.group(1)))
+                    foreign_key = _foreign_key_re.search(definition)
+                    reference = _references_re.search(definition)
+                    if foreign_key and reference:
+                        for column, ref_column in zip(_column_names(foreign_key.group(1)), _column_names(reference.group(2))):
+                            references.append((key, column, table_key(reference.group(1)), ref_column))
+                    continue
+
+                column_match = _identifier_re.match(definition)
+                if not column_match:
+                    continue
+                column = next(group for group in column_match.groups() if group is not None).lower()
+                table.columns[column] = " ".join(definition.split())
+                if re.search(r"PRIMARY\s+KEY", definition, re.IGNORECASE):
+                    table.primary_key.add(column)
+                reference = _references_re.search(definition)
+                if reference:
+                    references.append((key, column, table_key(reference.group(1)), _column_names(reference.group(2))[0]))
+
+            self.tables[key] = table
+            self.edges.setdefault(key, {})
+        return references
+
+    def add_relations(self, relations: str) -> None:
+        """
+        Reads free-text relationship notes: every line (or sentence) that mentions qualified
+        columns of two known tables, e.g. `SalesOrders.CustomerID = Customers.CustomerID`,
+        links those tables.
+        """
+        for line in re.split(r"[\n;]+", relations):
+            mentions = []
+            for qualifier, column in _qualified_column_re.findall(line):
+                table = table_key(qualifier.rstrip("."))
+                if table in self.tables:
+                    mentions.append((table, _column_names(column)[0]))
+            for (table, column), (other, other_column) in zip(mentions, mentions[1:]):
+                self.add_edge(table, column, other, other_column)
+
+    def add_edge(self, table: str, column: str, other: str, other_column: str) -> None:
+        if table == other or table not in self.tables or other not in self.tables:
+            return
+        self.edges.setdefault(table, {}).setdefault(other, set()).add((column, other_column))
+        self.edges.setdefault(other, {}).setdefault(table, set()).add((other_column, column))
+
+    def tables_defined_in(self, texts: Iterable[str]) -> List[str]:
+        """Known tables created by the DDL in `texts`, in order of first appearance."""
+        found = [table_key(match.group(1)) for text in texts for match in _create_table_re.finditer(text)]
+        return [table for table in dict.fromkeys(found) if table in self.tables]
+
+    def tables_used_in(self, texts: Iterable[str]) -> List[str]:
+        """Known tables that the SQL in `texts` selects from or joins, in order of first appearance."""
+        found = [table_key(name) for text in texts for name in _from_join_re.findall(text)]
+        return [table for table in dict.fromkeys(found) if table in self.tables]
+
+    def _shortest_path(self, source: str, target: str) -> Optional[List[str]]:
+        previous = {source: None}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            if node == target:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = previous[node]
+                return path[::-1]
+            for neighbour in self.edges.get(node, {}):
+                if neighbour not in previous:
+                    previous[neighbour] = node
+                    queue.append(neighbour)
+        return None
+
+    def connect(self, terminals: List[str], max_path_length: int = 3) -> List[str]:
+        """
+        Tables that connect `terminals`: a minimum spanning tree over the shortest join paths
+        between them, with the paths expanded. Terminals that cannot be joined within
+        `max_path_length` hops are kept on their own.
+        """
+        terminals = [table for table in dict.fromkeys(terminals) if table in self.tables]
+        if len(terminals) < 2:
+            return terminals
+
+        paths = {}
+        for i, source in enumerate(terminals):
+            for target in terminals[i + 1:]:
+                path = self._shortest_path(source, target)
+                if path is not None and len(path) - 1 <= max_path_length:
+                    paths[(source, target)] = path
+
+        # Prim's algorithm on the terminals, weighted by join path length
+        selected = list(terminals[:1])
+        tree_nodes = list(terminals[:1])
+        remaining = set(terminals[1:])
+        while remaining:
+            best = None
+            for source in selected:
+                for target in remaining:
+                    path = paths.get((source, target)) or paths.get((target, source))
+                    if path is not None and (best is None or len(path) < len(best[1])):
+                        best = (target, path)
+            if best is None:
+                # Not joinable with anything selected so far; start a new component
+                target = next(table for table in terminals if table in remaining)
+                best = (target, [target])
+            target, path = best
+            selected.append(target)
+            remaining.discard(target)
+            tree_nodes.extend(path)
+
+        return list(dict.fromkeys(tree_nodes))
+
+    def join_conditions(self, tables: List[str]) -> List[str]:
+        selected = set(tables)
+        lines = []
+        for table in tables:
+            for other, columns in self.edges.get(table, {}).items():
+                if other in selected and table < other:
+                    for column, other_column in sorted(columns):
+                        lines.append(
+                            f"{quote_identifier(self.tables[table].name)}.{quote_identifier(column)} = "
+                            f"{quote_identifier(self.tables[other].name)}.{quote_identifier(other_column)}"
+                        )
+        return lines
+
+    def render(self, tables: List[str], question: str, hints: Iterable[str] = (), max_columns: int = 15) -> List[str]:
+        """
+        DDL for `tables`. Tables wider than `max_columns` keep only their key and join columns
+        and the columns whose names overlap the question or appear in `hints` (example SQL).
+        """
+        question_words = _words(question)
+        hint_identifiers = {word.lower() for hint in hints for word in re.findall(r"\w+", hint)}
+        selected = set(tables)
+
+        rendered = []
+        for key in tables:
+            table = self.tables[key]
+            columns = list(table.columns)
+            if len(columns) > max_columns:
+                keep = set(table.primary_key)
+                for other, pairs in self.edges.get(key, {}).items():
+                    if other in selected:
+                        keep.update(column for column, _ in pairs)
+                keep.update(column for column in columns if column in hint_identifiers or _words(column) & question_words)
+                columns = [column for column in columns if column in keep]
+
+            lines = [f"    {table.columns[column]}" for column in columns]
+            omitted = len(table.columns) - len(columns)
+            body = ",\n".join(lines)
+            if omitted:
+                body += f"\n    -- {omitted} more columns not relevant to this question"
+            rendered.append(f"CREATE TABLE {quote_identifier(table.name)} (\n{body}\n)")
+        return rendered
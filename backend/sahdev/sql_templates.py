@@ -0,0 +1,270 @@
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+_string_literal_re = re.compile(r"N?'((?:[^']|'')*)'")
+_number_re = re.compile(r"(?<![\w.])\d+(?![\w.])")
+_question_word_re = re.compile(r"[\w&.-]+")
+_months = [
+    "january", "february", "march", "april", "may", "june",
+    "july", "august", "september", "october", "november", "december",
+]
+_month_index = {**{name: i + 1 for i, name in enumerate(_months)}, **{name[:3]: i + 1 for i, name in enumerate(_months) if name != "may"}}
+
+# What a slot may capture in a new question; a string slot takes as many words as the trained value
+_word_pattern = r"[\w&.-]+"
+_slot_patterns = {
+    "number": r"\d+",
+    "month": "|".join(sorted(_month_index, key=len, reverse=True)),
+}
+_max_phrase_words = 4
+
+
+def _slot_pattern(slot: "Slot") -> str:
+    if slot.kind == "string":
+        words = len(_question_word_re.findall(slot.value))
+        return _word_pattern + (rf"(?:\s+{_word_pattern}){{{words - 1}}}" if words > 1 else "")
+    return _slot_patterns[slot.kind]
+
+
+def sql_string_literals(sql: str) -> List[str]:
+    """Contents of the string literals of `sql`, without LIKE wildcards and unescaped."""
+    return [content.strip("%").replace("''", "'") for content in _string_literal_re.findall(sql)]
+
+
+@dataclass
+class Slot:
+    kind: str  # "string", "number" or "month"
+    value: str  # the value in the trained question
+
+
+@dataclass
+class SqlTemplate:
+    """
+    A trained question/SQL pair with its literals turned into slots: `pattern` matches
+    questions that differ only in those literals, `sql_parts` is the SQL with slot indexes
+    where the literals were.
+    """
+    question: str
+    pattern: re.Pattern
+    slots: List[Slot]
+    sql_parts: List[Union[str, int]]
+
+    @property
+    def specificity(self) -> int:
+        # Characters of fixed question text; longer templates are less likely to match by accident
+        return len(self.question) - sum(len(slot.value) for slot in self.slots)
+
+    def bind(self, question: str, known_values: Optional[Dict[str, str]] = None) -> Optional[str]:
+        """
+        The SQL with the literals of `question` bound in, or None when it does not match. A
+        new string value must be one of `known_values` (lower-cased value -> value as stored):
+        a phrase that merely fits the slot, like "all channels", is not trusted to be a value
+        of the column.
+        """
+        known_values = known_values or {}
+        match = self.pattern.match(question)
+        if not match:
+            return None
+
+        values = []
+        for slot, captured in zip(self.slots, match.groups()):
+            if slot.kind == "month":
+                values.append(str(_month_index[captured.lower()]))
+            elif slot.kind == "string":
+                value = " ".join(captured.split())
+                if value.lower() == slot.value.lower():
+                    value = slot.value
+                elif value.lower() in known_values:
+                    value = known_values[value.lower()]
+                else:
+                    return None
+                values.append(value.replace("'", "''"))
+            else:
+                values.append(captured)
+        return "".join(values[part] if isinstance(part, int) else part for part in self.sql_parts)
+
+
+def _question_phrases(question: str):
+    """Yields (start, end, text) of every run of up to _max_phrase_words words, longest first."""
+    words = list(_question_word_re.finditer(question))
+    for size in range(_max_phrase_words, 0, -1):
+        for i in range(len(words) - size + 1):
+            start, end = words[i].start(), words[i + size - 1].end()
+            yield start, end, question[start:end]
+
+
+def compile_template(question: str, sql: str) -> Optional[SqlTemplate]:
+    """
+    Finds the literals of `question` that are also literals of `sql`:
+
+    - a phrase equal to the whole content of a string literal (`'Exports'`, `'%Exports%'`),
+    - a number that occurs exactly once as a number in the SQL (`TOP 10`, `= 2024`),
+    - a month name whose number occurs exactly once in the SQL (`MONTH(OrderDate) = 3`).
+
+    Returns None when the pair has no such literal or its slots cannot be told apart.
+    """
+    literal_spans = [(m.start(1), m.end(1), m.group(1)) for m in _string_literal_re.finditer(sql)]
+    number_spans = [
+        (m.start(), m.end(), m.group(0)) for m in _number_re.finditer(sql)
+        if not any(start - 1 <= m.start() < end + 1 for start, end, _ in literal_spans)
+    ]
+
+    # question span -> (slot, [sql spans to replace])
+    found: List[Tuple[int, int, Slot, List[Tuple[int, int]]]] = []
+    taken = []
+    for start, end, phrase in _question_phrases(question):
+        if any(start < taken_end and taken_start < end for taken_start, taken_end in taken):
+            continue
+
+        slot, sql_spans = None, []
+        if phrase.isdigit():
+            matches = [(s, e) for s, e, number in number_spans if int(number) == int(phrase)]
+            if len(matches) == 1:
+                slot, sql_spans = Slot("number", phrase), matches
+        elif phrase.lower() in _month_index:
+            matches = [(s, e) for s, e, number in number_spans if int(number) == _month_index[phrase.lower()]]
+            if len(matches) == 1:
+                slot, sql_spans = Slot("month", phrase), matches
+
+        if slot is None and re.search(r"[^\W\d_]", phrase):
+            for literal_start, literal_end, content in literal_spans:
+                stripped = content.strip("%")
+                if stripped.replace("''", "'").lower() == phrase.lower():
+                    offset = literal_start + content.index(stripped)
+                    sql_spans.append((offset, offset + len(stripped)))
+            if sql_spans:
+                slot = Slot("string", phrase)
+
+        if slot is not None:
+            found.append((start, end, slot, sql_spans))
+            taken.append((start, end))
+
+    if not found:
+        return None
+    found.sort(key=lambda item: item[0])
+
+    pattern, position = [r"^\s*"], 0
+    for index, (start, end, slot, _) in enumerate(found):
+        fixed = question[position:start]
+        if index and not fixed.strip():
+            if "string" in (slot.kind, found[index - 1][2].kind):
+                # A string slot next to another slot: a new question could split either way
+                return None
+            pattern.append(r"\s+" if fixed else "")
+        else:
+            pattern.append(_fixed_pattern(fixed))
+        pattern.append(f"({_slot_pattern(slot)})")
+        position = end
+    pattern.append(_fixed_pattern(question[position:].rstrip(" ?.!")) + r"[\s?.!]*$")
+
+    replacements = sorted(
+        (sql_start, sql_end, index)
+        for index, (_, _, _, sql_spans) in enumerate(found)
+        for sql_start, sql_end in sql_spans
+    )
+    sql_parts, position = [], 0
+    for sql_start, sql_end, index in replacements:
+        sql_parts.extend([sql[position:sql_start], index])
+        position = sql_end
+    sql_parts.append(sql[position:])
+
+    return SqlTemplate(
+        question=question,
+        pattern=re.compile("".join(pattern), re.IGNORECASE),
+        slots=[slot for _, _, slot, _ in found],
+        sql_parts=sql_parts,
+    )
+
+
+def _fixed_pattern(text: str) -> str:
+    return r"\s+".join(re.escape(part) for part in re.split(r"\s+", text)) if text else ""
+
+
+class SqlTemplateCache:
+    """
+    Answers questions that differ from a trained question only in a literal without calling
+    the LLM. Each trained question/SQL pair is compiled once into a `SqlTemplate`; a new
+    question is checked against the compiled templates of its retrieved examples, and on a
+    full match the new values are bound into the trained SQL.
+
+    Example:
+    ```python
+    cache = SqlTemplateCache()
+    sql = cache.lookup("Top 5 customers for Domestic in March", related.question_sql_list)
+    print(cache.stats())
+    ```
+    """
+
+    def __init__(self, max_templates: int = 4096):
+        self.max_templates = max_templates
+        self._templates: "OrderedDict[Tuple[str, str], Optional[SqlTemplate]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.exact_hits = 0
+        self.template_hits = 0
+
+    def template_for(self, question: str, sql: str) -> Optional[SqlTemplate]:
+        key = (question, sql)
+        with self._lock:
+            if key in self._templates:
+                self._templates.move_to_end(key)
+                return self._templates[key]
+
+        template = compile_template(question, sql)
+        with self._lock:
+            self._templates[key] = template
+            while len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+        return template
+
+    def lookup(self, question: str, question_sql_list: list, templates: bool = True, known_values=()) -> Optional[str]:
+        """
+        The stored SQL of an identical trained question, else (with `templates`) the SQL of the
+        most specific matching template with the new values bound, else None. New string values
+        are only bound when they are string literals of a retrieved example or in `known_values`
+        (e.g. the distinct values of the column); anything else goes to the LLM.
+        """
+        examples = [item for item in question_sql_list if isinstance(item, dict) and item.get("question") and item.get("sql")]
+        with self._lock:
+            self.lookups += 1
+
+        for item in examples:
+            if item["question"] == question:
+                with self._lock:
+                    self.exact_hits += 1
+                return item["sql"]
+        if not templates:
+            return None
+
+        known = {value.lower(): value for value in known_values}
+        for item in examples:
+            known.update((value.lower(), value) for value in sql_string_literals(item["sql"]))
+
+        best = None
+        for item in examples:
+            template = self.template_for(item["question"], item["sql"])
+            if template is None or (best is not None and template.specificity <= best[0].specificity):
+                continue
+            sql = template.bind(question, known)
+            if sql is not None:
+                best = (template, sql)
+
+        if best is None:
+            return None
+        with self._lock:
+            self.template_hits += 1
+        return best[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.template_hits
+            return {
+                "lookups": self.lookups,
+                "exact_hits": self.exact_hits,
+                "template_hits": self.template_hits,
+                "hit_rate": hits / self.lookups if self.lookups else 0.0,
+                "templates": len(self._templates),
+            }
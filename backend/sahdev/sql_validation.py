@@ -0,0 +1,129 @@
+from typing import Dict, List, Optional, Set
+
+from .exceptions import ValidationError
+from .schema_graph import quote_identifier
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.errors import ParseError
+    from sqlglot.optimizer.scope import traverse_scope
+except ImportError:
+    sqlglot = None
+
+# Listing more columns than this in an error message costs prompt tokens without helping the retry
+_max_listed_columns = 40
+_system_schemas = ("sys", "information_schema")
+
+
+class SqlValidator:
+    """
+    Checks LLM-generated SQL locally before it is sent to the database:
+
+    - it must parse in `dialect`,
+    - it must be a single query (SELECT, set operation or CTE), and not SELECT ... INTO,
+    - with a `schema`, every column of a known table must exist in that table. Tables
+      missing from the schema (views, tables left out of the training DDL) are not
+      checked: the database is the judge of those.
+
+    Problems are raised as `ValidationError` with messages precise enough to be fed back
+    into the retry prompt. Without sqlglot installed, `validate` accepts everything.
+
+    Example:
+    ```python
+    validator = SqlValidator(dialect="tsql")
+    validator.validate(sql, schema={"salesorders": {"orderid", "customerid"}})
+    ```
+    """
+
+    def __init__(self, dialect: str = "tsql"):
+        self.dialect = dialect
+
+    @property
+    def available(self) -> bool:
+        return sqlglot is not None
+
+    def validate(self, sql: str, schema: Optional[Dict[str, Set[str]]] = None) -> None:
+        if sqlglot is None:
+            return
+
+        try:
+            statements = [statement for statement in sqlglot.parse(sql, read=self.dialect) if statement is not None]
+        except ParseError as e:
+            error = e.errors[0] if e.errors else {}
+            location = f" at line {error.get('line')}, column {error.get('col')}" if error.get("line") else ""
+            raise ValidationError(f"SQL syntax error{location}: {error.get('description', str(e))}")
+
+        if not statements:
+            raise ValidationError("No SQL statement found")
+        if len(statements) > 1:
+            raise ValidationError(f"Expected a single SELECT statement, got {len(statements)} statements")
+
+        query = statements[0]
+        if not isinstance(query, exp.Query):
+            raise ValidationError(f"Only SELECT queries are allowed, got a {query.key.upper()} statement")
+        if any(select.args.get("into") for select in query.find_all(exp.Select)):
+            raise ValidationError("SELECT ... INTO is not allowed, only read queries")
+
+        if schema:
+            errors = self.schema_errors(query, schema)
+            if errors:
+                raise ValidationError("\n".join(errors))
+
+    def schema_errors(self, query, schema: Dict[str, Set[str]]) -> List[str]:
+        """Unknown columns of the known tables of a parsed query, one message each."""
+        errors = []
+        scopes = traverse_scope(query)
+        # Columns of every known table the query reads, for correlated references to an outer query
+        query_columns = set()
+        for table in query.find_all(exp.Table):
+            query_columns |= schema.get(table.name.lower(), set())
+
+        for scope in scopes:
+            # T-SQL identifiers are case-insensitive
+            tables = {
+                alias.lower(): source for alias, source in scope.sources.items()
+                if isinstance(source, exp.Table)
+            }
+            # Temporary tables, catalog views and tables of other databases are never checked
+            known = {
+                alias: schema[source.name.lower()] for alias, source in tables.items()
+                if source.name.lower() in schema and not (
+                    source.name.startswith("#") or source.catalog or source.db.lower() in _system_schemas
+                )
+            }
+            # Unqualified columns can only be checked when every source of the scope is a known table
+            all_known = len(known) == len(scope.sources)
+            select_aliases = {
+                projection.alias.lower() for projection in getattr(scope.expression, "expressions", [])
+                if isinstance(projection, exp.Alias)
+            }
+
+            for column in scope.columns:
+                if isinstance(column.this, exp.Star):
+                    continue
+                # sqlglot also lists the unqualified columns of subqueries in the outer scope
+                if column.find_ancestor(exp.Select) is not scope.expression:
+                    continue
+                name = column.name.lower()
+                if column.table:
+                    columns = known.get(column.table.lower())
+                    if columns is not None and name not in columns:
+                        errors.append(self._unknown_column(column.name, tables[column.table.lower()].name, columns))
+                elif all_known and known and name not in select_aliases and not any(name in columns for columns in known.values()) \
+                        and not (scope.parent is not None and name in query_columns):
+                    if len(known) == 1:
+                        alias, columns = next(iter(known.items()))
+                        errors.append(self._unknown_column(column.name, tables[alias].name, columns))
+                    else:
+                        names = ", ".join(sorted({quote_identifier(source.name) for source in tables.values()}))
+                        errors.append(f"Unknown column {quote_identifier(column.name)}: it is not a column of any of {names}")
+
+        return list(dict.fromkeys(errors))
+
+    @staticmethod
+    def _unknown_column(column: str, table: str, columns: Set[str]) -> str:
+        listed = sorted(columns)
+        more = f" and {len(listed) - _max_listed_columns} more" if len(listed) > _max_listed_columns else ""
+        listed = [quote_identifier(name) for name in listed[:_max_listed_columns]]
+        return f"Unknown column {quote_identifier(column)} in table {quote_identifier(table)}. Its columns are: {', '.join(listed)}{more}"
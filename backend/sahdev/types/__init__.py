@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Dict, List, Union
 
 
@@ -211,6 +211,23 @@ class TrainingData:
     documentation: List[str]
 
 
+@dataclass
+class RelatedTrainingData:
+    """
+    Everything retrieved for one question in a single pass. Each list is ordered
+    by similarity (best first) and the matching `*_scores` list holds the
+    cosine similarity of every entry.
+    """
+    question_sql_list: List[dict] = field(default_factory=list)
+    ddl_list: List[str] = field(default_factory=list)
+    doc_list: List[str] = field(default_factory=list)
+    rel_list: List[str] = field(default_factory=list)
+    question_sql_scores: List[float] = field(default_factory=list)
+    ddl_scores: List[float] = field(default_factory=list)
+    doc_scores: List[float] = field(default_factory=list)
+    rel_scores: List[float] = field(default_factory=list)
+
+
 @dataclass
 class TrainingPlanItem:
     item_type: str
@@ -6,30 +6,25 @@ from concurrent.futures import ThreadPoolExecutor
 import logging
 from fastapi import HTTPException, status
 
-import os
 
 import json
 from backend.services.sahdevvv import sd
 from datetime import datetime
 from backend.services.custom_json import TableDataSerializer
+from backend.core.config import settings
 from backend.services.summary_generator import DataframeSummary
 from backend.services.prompt_next_question import PromptQuestion
 from backend.services.get_history import getContext  # Import the GetContext class
 from backend.database.mongodb import MongoDB
-
-
-
-from diskcache import Cache
- 
-cache_dir = os.path.join(os.path.dirname(__file__), "../cache_directory")
-#cache_dir = "./backend/cache_directory"
-cache = Cache(cache_dir,size_limit=int(1e12),eviction_policy="none")
+from backend.services.response_cache import ResponseCacheKey, response_cache
+from backend.services.pipeline import TurnPipeline
 
 
 class AIService:
     _instance = None
     _executor = ThreadPoolExecutor(max_workers=10)
     _active_sessions = {} 
+    STREAM_PAGE_SIZE = 200  # rows per `rows` event of the streaming endpoint
 
     def __init__(self):
         # Configure environment first
@@ -88,25 +83,20 @@ class AIService:
         return persona
 
     # async def get_ai_response(self, message: str, user_id: str,session_id:str) -> str:
-    async def get_ai_response(self, user_message: str, user_id: str, session_id: str, current_user: dict) -> dict:
-        """Get AI response asynchronously with user-isolated context"""
+    async def get_ai_response(self, user_message: str, user_id: str, session_id: str, current_user: dict, persona: Optional[str] = None, message_count: Optional[int] = None) -> dict:
+        """Get AI response asynchronously with user-isolated context.
+
+        The turn runs as a TurnPipeline: the persona, the Mongo history fetch, the training
+        generation and the next-question lookup start together, and each later stage (cache
+        lookup, SQL generation and execution, summary) starts as soon as its inputs are ready.
+        Pass `persona` and `message_count` when the caller already has the session document, to
+        skip refetching the persona and to detect turns the history buffer has missed.
+        """
         try:
-
-            persona=await self.get_persona(session_id,current_user)
-            context_str=await getContext.get_session_context(user_id=user_id,session_id=session_id)
-            print(f"Context string is ",context_str)
-            response = await asyncio.get_event_loop().run_in_executor(
-                self._executor,
-                self._process_user_message,
-                user_message,
-                # user_id,
-                # session_id,
-                context_str,
-                persona    # <--- pass it to the sync method
-            )
-
-
-
+            pipeline = self._build_turn_pipeline(user_message, user_id, session_id, current_user, persona, message_count)
+            results = await pipeline.run()
+            response = results["response"]
+            response['timings'] = pipeline.timings
             return response
         except Exception as e:
             logging.error(f"AI Service error for user {user_id}: {str(e)}")
@@ -114,79 +104,235 @@ class AIService:
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to generate AI response"
             )
-        
 
+    def _build_turn_pipeline(self, message: str, user_id: str, session_id: str, current_user: dict, persona: Optional[str], message_count: Optional[int] = None) -> TurnPipeline:
+        pipeline = TurnPipeline(name=f"Chat turn {session_id}")
 
+        async def persona_stage():
+            if persona is not None:
+                return persona
+            return await self.get_persona(session_id, current_user)
 
+        async def context_stage():
+            context_str = await getContext.get_session_context(user_id=user_id, session_id=session_id, message_count=message_count)
+            print(f"Context string is ",context_str)
+            return context_str
 
-        
+        async def generation_stage():
+            return await self._run_blocking(sd.get_training_generation)
 
-    def _process_user_message(self, message: str,context_str:str,persona: str) -> dict:
-        """Process message with user-specific interpreter context"""
-        #### Cache #########
+        async def cache_stage(persona, context, generation):
+            cache_key = ResponseCacheKey.build(message, persona, context, generation)
+            # Near-duplicate questions with the same persona, context and training data
+            cached_response = await self._run_blocking(response_cache.lookup, cache_key)
+            if cached_response:
+                print("Cache hit!")
+            else:
+                print("Cache miss! Processing...")
+            return cache_key, cached_response
+
+        async def next_question_stage(persona):
+            try:
+                next_question = await PromptQuestion.get_similar_question_async(message, persona)
+            except Exception as e:
+                logging.error(f"Next question lookup failed: {e}")
+                return None
+            print("Suggested next question : ",next_question)
+            return next_question
+
+        async def query_stage(cache, context):
+            _, cached_response = cache
+            if cached_response:
+                return None
+            try:
+                return await sd.execute_query_with_retries_async(message, context)
+            except Exception as e:
+                logging.error(f"Chat processing error: {e}")
+                return e
+
+        async def summary_stage(query):
+            if query is None or isinstance(query, Exception):
+                return None
+            _, df, _ = query
+            if df is None or df.empty:
+                return None
+            print(df.head())
+            df.to_csv("temp.csv")
+            summary_object = DataframeSummary(df)
+            return await self._run_blocking(summary_object.generate_summary, message)
+
+        async def response_stage(cache, context, query, summary, next_question):
+            cache_key, cached_response = cache
+            if cached_response:
+                return cached_response
+
+            if isinstance(query, Exception):
+                stringgg = await sd.generate_fallback_response_async(message, "", context)
+                return {
+                    'type': 'text',
+                    'content': stringgg,
+                    'next_question': next_question
+                }
 
-        cache_key = message
-    
-        # Check cache
-        cached_response = cache.get(cache_key)
+            extracted_sql, df, msg = query
+            if df is not None and not df.empty:
+                # Convert DataFrame to dict for JSON serialization
+                table_data = TableDataSerializer.serialize_frame(df, settings.TABLE_DATA_FORMAT)
+                table_data['truncated'] = df.attrs.get('truncated', False)
+                ai_response = {
+                    'type': 'sql_response',
+                    'content': extracted_sql,
+                    'data': table_data,
+                    'summary': summary,
+                    'next_question': next_question
+                }
+            else:
+                ai_response = {
+                    'type': 'text',
+                    'content': msg,
+                    'next_question': next_question
+                }
+
+            await self._run_blocking(response_cache.store, cache_key, ai_response)
+            return ai_response
+
+        pipeline.add("persona", persona_stage)
+        pipeline.add("context", context_stage)
+        pipeline.add("generation", generation_stage)
+        pipeline.add("next_question", next_question_stage, deps=["persona"])
+        pipeline.add("cache", cache_stage, deps=["persona", "context", "generation"])
+        pipeline.add("query", query_stage, deps=["cache", "context"])
+        pipeline.add("summary", summary_stage, deps=["query"])
+        pipeline.add("response", response_stage, deps=["cache", "context", "query", "summary", "next_question"])
+        return pipeline
+
+    async def stream_ai_response(self, user_message: str, user_id: str, session_id: str, current_user: dict, persona: Optional[str] = None, message_count: Optional[int] = None):
+        """Stream the AI response as (event, data) pairs, in this order:
+
+        `sql` (every generated query), `rows` (pages of the result table), `summary`
+        (interpreter tokens), `next_question`, and finally `done` carrying the complete
+        response dict, shaped like the one `get_ai_response` returns.
+        """
+        if persona is None:
+            persona = await self.get_persona(session_id, current_user)
+        context_str, generation = await asyncio.gather(
+            getContext.get_session_context(user_id=user_id, session_id=session_id, message_count=message_count),
+            self._run_blocking(sd.get_training_generation),
+        )
+        cache_key = ResponseCacheKey.build(user_message, persona, context_str, generation)
+        cached_response = await self._run_blocking(response_cache.lookup, cache_key)
         if cached_response:
             print("Cache hit!")
-            return cached_response
-    
-        print("Cache miss! Processing...")
-        prompt_question_object=PromptQuestion
-        print("*"*80)
-        print(context_str)
-        print("*"*80)
-
-        print("Suggested next question : ",prompt_question_object.get_similar_question(message,persona))
-        next_question=prompt_question_object.get_similar_question(message,persona)
+            async for event in self._replay_response(cached_response):
+                yield event
+            return
 
-        print("Got history")
+        next_question_task = asyncio.ensure_future(
+            PromptQuestion.get_similar_question_async(user_message, persona)
+        )
 
         try:
-            
-            extracted_sql,df,msg = sd.execute_query_with_retries(message,context_str)
+            sql_queue = asyncio.Queue()
+            query_task = asyncio.ensure_future(
+                sd.execute_query_with_retries_async(user_message, context_str, on_sql=sql_queue.put_nowait)
+            )
+            async for sql in self._drain_queue(sql_queue, query_task):
+                yield "sql", {"sql": sql}
+            extracted_sql, df, msg = query_task.result()
 
-            print(df.head())
-            
-            if not df.empty:
-                # Convert DataFrame to dict for JSON serialization
+            if df is not None and not df.empty:
                 df.to_csv("temp.csv")
-                tds=TableDataSerializer
-                df_dict = df.to_dict('records')
-                df_dict_serialized = tds.serialize_records(df_dict)
-                df_columns = df.columns.tolist()
-                summary_object=DataframeSummary(df)
-                summary=summary_object.generate_summary(question=message)
+                table_data = TableDataSerializer.serialize_frame(df, settings.TABLE_DATA_FORMAT)
+                table_data['truncated'] = df.attrs.get('truncated', False)
+                async for event in self._stream_rows(table_data):
+                    yield event
+
+                summary_parts = []
+                async for token in self._stream_summary(df, user_message):
+                    summary_parts.append(token)
+                    yield "summary", {"token": token}
+
                 ai_response = {
                     'type': 'sql_response',
                     'content': extracted_sql,
-                    'data': {
-                        'records': df_dict_serialized,
-                        'columns': df_columns
-                    },
-                    'summary':summary,
-                    'next_question':next_question
+                    'data': table_data,
+                    'summary': "".join(summary_parts),
                 }
-                
-
             else:
+                yield "text", {"content": msg}
                 ai_response = {
                     'type': 'text',
                     'content': msg,
-                    'next_question': next_question
                 }
-
-            #self._save_chat_interaction(user_id, message, ai_response['content'])
-            cache.set(cache_key, ai_response, expire=None)
-            return ai_response
+            cacheable = True
 
         except Exception as e:
-            logging.error(f"Chat processing error: {e}")
-            stringgg=sd.generate_fallback_response(message,"",context_str)
-            return {
+            logging.error(f"Chat streaming error: {e}")
+            fallback = await sd.generate_fallback_response_async(user_message, "", context_str)
+            yield "text", {"content": fallback}
+            ai_response = {
                 'type': 'text',
-               'content':stringgg,
-               'next_question':next_question
-            }
\ No newline at end of file
+                'content': fallback,
+            }
+            cacheable = False
+
+        ai_response['next_question'] = await next_question_task
+        yield "next_question", {"next_question": ai_response['next_question']}
+
+        if cacheable:
+            await self._run_blocking(response_cache.store, cache_key, ai_response)
+        yield "done", ai_response
+
+    async def _replay_response(self, ai_response: dict):
+        """Emit a cached response with the same events as a freshly generated one"""
+        if ai_response['type'] == 'sql_response':
+            yield "sql", {"sql": ai_response['content']}
+            async for event in self._stream_rows(ai_response['data']):
+                yield event
+            yield "summary", {"token": ai_response.get('summary') or ""}
+        else:
+            yield "text", {"content": ai_response['content']}
+        yield "next_question", {"next_question": ai_response.get('next_question')}
+        yield "done", ai_response
+
+    async def _stream_rows(self, table_data: dict):
+        """Emit the rows of a table_data payload as `rows` events of STREAM_PAGE_SIZE rows"""
+        for offset in range(0, TableDataSerializer.row_count(table_data), self.STREAM_PAGE_SIZE):
+            page = TableDataSerializer.slice_rows(table_data, offset, self.STREAM_PAGE_SIZE)
+            yield "rows", {"offset": offset, **page}
+
+    async def _drain_queue(self, queue: asyncio.Queue, task: asyncio.Future):
+        """Yield items put on `queue` until `task` has finished and the queue is empty"""
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                yield getter.result()
+                continue
+            getter.cancel()
+            while not queue.empty():
+                yield queue.get_nowait()
+            return
+
+    async def _stream_summary(self, df, question: str):
+        """Run the blocking interpreter summary on the thread pool and yield its tokens as they arrive"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        summary_object = DataframeSummary(df)
+
+        def produce():
+            for token in summary_object.generate_summary_stream(question):
+                loop.call_soon_threadsafe(queue.put_nowait, token)
+
+        producer = loop.run_in_executor(self._executor, produce)
+        async for token in self._drain_queue(queue, producer):
+            yield token
+        try:
+            producer.result()
+        except Exception as e:
+            logging.error(f"Summary streaming error: {e}")
+            yield f"Error generating summary: {e}"
+
+    async def _run_blocking(self, func, *args):
+        """Run a blocking helper (cache, embeddings, interpreter) on the shared thread pool"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
@@ -1,14 +1,18 @@
 from typing import List, Optional, Dict, Any, Union
 from fastapi import HTTPException, status
-from backend.models.chat import ChatMessage, ChatResponse, ChatSession
+from backend.models.chat import ChatMessage, ChatResponse, ChatSession, ChatSessionSummary
 from backend.database.mongodb import MongoDB
 from datetime import datetime
 from bson import ObjectId
 import logging
 import json
+import base64
+import asyncio
 from .ai_service import AIService
-import pandas as pd
 from backend.services.ask_df import AskDF
+from backend.services.custom_json import TableDataSerializer
+from backend.services.table_store import table_store
+from backend.services.get_history import getContext
 import os
 from backend.services.prompt_next_question import PromptQuestion
 import pytz
@@ -18,7 +22,8 @@ import pytz
 class ChatService:
     def __init__(self):
         self.sessions_collection = "chats"
-      
+        self.messages_collection = "chat_messages"
+
         self.ai_service = AIService.get_instance()
 
     def _serialize_datetime(self, obj: Any) -> Any:
@@ -44,6 +49,30 @@ class ChatService:
                 return obj
         return obj
 
+    def _message_doc(self, message: Union[ChatMessage, ChatResponse], user_id: str) -> dict:
+        """Document stored in chat_messages for one message"""
+        message_dict = self._serialize_datetime(message.model_dump())
+        message_dict["user_id"] = user_id
+        return message_dict
+
+    async def _append_messages(self, session_id: str, user_id: str, message_docs: List[dict], last_message: str) -> None:
+        """Insert messages into chat_messages and bump the session's last message and counters"""
+        messages = await MongoDB.get_collection(self.messages_collection)
+        sessions = await MongoDB.get_collection(self.sessions_collection)
+        await messages.insert_many(message_docs, ordered=True)
+        getContext.history_buffer.append(session_id, user_id, message_docs)
+        await sessions.update_one(
+            {"id": session_id},
+            {
+                "$set": {
+                    "last_message": last_message,
+                    # Stored as an ISO string like at creation, so session listing sorts on a single type
+                    "timestamp": datetime.now(pytz.timezone("Asia/Kolkata")).isoformat()
+                },
+                "$inc": {"message_count": len(message_docs)}
+            }
+        )
+
 
     async def create_session(self,module:str, user: dict) -> ChatSession:
         try:
@@ -51,8 +80,7 @@ class ChatService:
 
             # Extract persona dynamically from the user dict
             persona = module   #user.get("persona", "ESP")  # Get the persona details when the user clicked the option 
-            prompt_question_object = PromptQuestion()
-            first_question = prompt_question_object.get_first_question(persona)
+            first_question = await PromptQuestion.get_first_question_async(persona)
             print("Suggested next question:", first_question)
 
             # Set a temporary title for the session
@@ -75,8 +103,14 @@ class ChatService:
                 ]
             )
 
-            session_dict = self._serialize_datetime(session.model_dump())
+            # Messages live in chat_messages; the session document only keeps its metadata
+            session_dict = self._serialize_datetime(session.model_dump(exclude={"messages"}))
+            session_dict["message_count"] = len(session.messages)
             await sessions.insert_one(session_dict)
+            messages = await MongoDB.get_collection(self.messages_collection)
+            message_docs = [self._message_doc(message, session.user_id) for message in session.messages]
+            await messages.insert_many(message_docs)
+            getContext.history_buffer.load(session_id, session.user_id, message_docs, complete=True)
             return session
 
         except Exception as e:
@@ -94,7 +128,7 @@ class ChatService:
             print("session id is ",session_id)
             print("user id is ",user["id"])
             # Verify session exists and belongs to the user
-            session = await sessions.find_one({"id": session_id, "user_id": str(user["id"])})
+            session = await sessions.find_one({"id": session_id, "user_id": str(user["id"])}, {"messages": 0})
             if not session:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
@@ -112,84 +146,125 @@ class ChatService:
 
  
 
-            # Update the session title dynamically (use first 5 words but max 20 characters)
-            if len(session.get("messages", [])) == 1:  # If it's the first user message
-                words = text.split()  # Split text into words
-                title_words = []
-                char_count = 0
-
-                persona = session.get("persona", "")  # Get the persona
-                persona_prefix = f"{persona}-" if persona else ""  # Format as "persona-"
-                max_length = 20 - len(persona_prefix)  # Adjust max length considering persona prefix
-
-                for word in words:
-                    if len(title_words) < 5 and (char_count + len(word) + (1 if title_words else 0)) <= max_length:
-                        title_words.append(word)
-                        char_count += len(word) + (1 if title_words else 0)  # +1 for spaces
-                    else:
-                        break
-
-                new_title = persona_prefix + " ".join(title_words) + ("..." if len(text) > (char_count + len(persona_prefix)) else "")  # Add ellipsis if needed
-
-                await sessions.update_one(
-                    {"id": session_id},
-                    {"$set": {"title": new_title}}
+            # Update the title while the AI response is being generated
+            _, ai_response = await asyncio.gather(
+                self._update_title(sessions, session, text),
+                self.ai_service.get_ai_response(
+                    user_message=text,
+                    user_id=str(user["id"]),
+                    session_id=session_id,
+                    current_user=user,
+                    persona=session.get("persona"),
+                    message_count=session.get("message_count")
                 )
+            )
 
+            return await self._save_exchange(session_id, str(user["id"]), user_message, ai_response)
 
+        except HTTPException:
+            raise
+        except Exception as e:
+            logging.error(f"Failed to process message: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to process message"
+            )
 
+    async def stream_message(self, text: str, session_id: str, user: dict):
+        """
+        Streaming variant of `process_message`. Validates the session up front (so errors are
+        still plain HTTP errors) and returns an async iterator of (event, data) pairs from
+        `AIService.stream_ai_response`; once the answer is complete it is saved like a
+        regular message and a final `message` event carries the stored ChatResponse.
+        """
+        sessions = await MongoDB.get_collection(self.sessions_collection)
+        session = await sessions.find_one({"id": session_id, "user_id": str(user["id"])}, {"messages": 0})
+        if not session:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Chat session not found process message"
+            )
 
+        user_message = ChatMessage(
+            id=str(ObjectId()),
+            text=text,
+            sender="user",
+            session_id=session_id,
+            timestamp=datetime.now(pytz.timezone("Asia/Kolkata"))
+        )
+        await self._update_title(sessions, session, text)
 
+        return self._stream_exchange(session_id, user_message, user, session.get("persona"), session.get("message_count"))
 
-
-
-            # Get AI response
-            ai_response = await self.ai_service.get_ai_response(
-                user_message=text,
+    async def _stream_exchange(self, session_id: str, user_message: ChatMessage, user: dict, persona: Optional[str], message_count: Optional[int] = None):
+        try:
+            async for event, data in self.ai_service.stream_ai_response(
+                user_message=user_message.text,
                 user_id=str(user["id"]),
                 session_id=session_id,
-                current_user=user
-            )
+                current_user=user,
+                persona=persona,
+                message_count=message_count
+            ):
+                if event == "done":
+                    response = await self._save_exchange(session_id, str(user["id"]), user_message, data)
+                    yield "message", response.model_dump(mode="json")
+                else:
+                    yield event, data
+        except Exception as e:
+            logging.error(f"Failed to stream message: {str(e)}")
+            yield "error", {"detail": "Failed to process message"}
+
+    async def _update_title(self, sessions, session: dict, text: str) -> None:
+        # Update the session title dynamically (use first 5 words but max 20 characters)
+        # If it's the first user message; without a message_count the session's length is unknown
+        if session.get("message_count") == 1:
+            words = text.split()  # Split text into words
+            title_words = []
+            char_count = 0
+
+            persona = session.get("persona", "")  # Get the persona
+            persona_prefix = f"{persona}-" if persona else ""  # Format as "persona-"
+            max_length = 20 - len(persona_prefix)  # Adjust max length considering persona prefix
+
+            for word in words:
+                if len(title_words) < 5 and (char_count + len(word) + (1 if title_words else 0)) <= max_length:
+                    title_words.append(word)
+                    char_count += len(word) + (1 if title_words else 0)  # +1 for spaces
+                else:
+                    break
+
+            new_title = persona_prefix + " ".join(title_words) + ("..." if len(text) > (char_count + len(persona_prefix)) else "")  # Add ellipsis if needed
 
-            # Create the AI response message
-            response = ChatResponse(
-                id=str(ObjectId()),
-                text=ai_response['content'],
-                sender="bot",
-                session_id=session_id,
-                timestamp=datetime.now(pytz.timezone("Asia/Kolkata")),
-                response_type=ai_response['type'],
-                table_data=ai_response.get('data') if ai_response['type'] == 'sql_response' else None,
-                summary=ai_response.get('summary') if ai_response['type'] == 'sql_response' else None,
-                next_question=ai_response.get('next_question')
+            await sessions.update_one(
+                {"id": session["id"]},
+                {"$set": {"title": new_title}}
             )
 
-            # Serialize messages for MongoDB storage
-            user_message_dict = self._serialize_datetime(user_message.model_dump())
-            response_dict = self._serialize_datetime(response.model_dump())
+    async def _save_exchange(self, session_id: str, user_id: str, user_message: ChatMessage, ai_response: dict) -> ChatResponse:
+        # Create the AI response message
+        response = ChatResponse(
+            id=str(ObjectId()),
+            text=ai_response['content'],
+            sender="bot",
+            session_id=session_id,
+            timestamp=datetime.now(pytz.timezone("Asia/Kolkata")),
+            response_type=ai_response['type'],
+            table_data=ai_response.get('data') if ai_response['type'] == 'sql_response' else None,
+            summary=ai_response.get('summary') if ai_response['type'] == 'sql_response' else None,
+            next_question=ai_response.get('next_question')
+        )
 
-            # Update the session with the new messages
-            await sessions.update_one(
-                {"id": session_id},
-                {
-                    "$push": {"messages": {"$each": [user_message_dict, response_dict]}},
-                    "$set": {
-                        "last_message": response.text,
-                        "timestamp": datetime.now(pytz.timezone("Asia/Kolkata"))
-                    }
-                }
-            )
+        # Serialize messages for MongoDB storage
+        user_message_dict = self._message_doc(user_message, user_id)
+        response_dict = self._message_doc(response, user_id)
+        # Large result tables are stored on their own; the message keeps a preview and a reference
+        if table_store.needs_offload(response.table_data):
+            response_dict["table_data"] = await table_store.save(response.table_data, session_id, user_id, response.id)
 
-            return response
+        await self._append_messages(session_id, user_id, [user_message_dict, response_dict], response.text)
 
-        except HTTPException:
-            raise
-        except Exception as e:
-            logging.error(f"Failed to process message: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to process message"
-            )
+        return response
 
         
 
@@ -199,23 +274,47 @@ class ChatService:
         """
         Fetch a specific message by its ID from a session.
         """
-        sessions = await MongoDB.get_collection(self.sessions_collection)
-        session = await sessions.find_one({"id": session_id})
+        messages = await MongoDB.get_collection(self.messages_collection)
+        message = await messages.find_one({"id": message_id, "session_id": session_id}, {"_id": 0})
 
-        if not session:
-            logging.error(f"Session with ID {session_id} not found.")
+        if not message:
+            logging.error(f"Message with ID {message_id} not found in session {session_id}.")
             return None
 
-        for message in session.get("messages", []):
-            if message.get("id") == message_id:
-                logging.debug(f"Message found: {message}")
-                return ChatMessage(**message)
+        return ChatMessage(**message)
 
-        logging.error(f"Message with ID {message_id} not found in session {session_id}.")
-        return None
 
 
 
+    async def get_message_table(
+        self, session_id: str, message_id: str, user_id: str, offset: int = 0, limit: Optional[int] = None
+    ) -> dict:
+        """
+        Returns rows [offset, offset + limit) of the table of a message (all rows when limit is
+        None), after checking that the session belongs to user_id.
+        """
+        sessions = await MongoDB.get_collection(self.sessions_collection)
+        session = await sessions.find_one({"id": session_id, "user_id": user_id}, {"_id": 1})
+        if not session:
+            raise HTTPException(
+                status_code=404,
+                detail="Chat session not found or unauthorized."
+            )
+
+        message = await self.get_message_by_id(message_id, session_id)
+        if not message or not message.table_data:
+            raise HTTPException(
+                status_code=404,
+                detail="Message with table_data not found or doesn't exist in this session."
+            )
+        try:
+            return await table_store.load(message.table_data, offset, limit)
+        except KeyError as e:
+            logging.error(str(e))
+            raise HTTPException(
+                status_code=404,
+                detail="Table data of this message is no longer available."
+            )
 
     async def get_session_by_id(self, session_id: str, user_id: str) -> ChatSession:
         """
@@ -223,10 +322,13 @@ class ChatService:
         """
         try:
             sessions = await MongoDB.get_collection(self.sessions_collection)
-            session = await sessions.find_one({"id": session_id, "user_id": user_id})
+            session = await sessions.find_one({"id": session_id, "user_id": user_id}, {"_id": 0})
             if not session:
                 return None  # Return None if the session does not exist or does not belong to the user
-            
+
+            messages = await MongoDB.get_collection(self.messages_collection)
+            session["messages"] = await messages.find({"session_id": session_id}, {"_id": 0}).sort("timestamp", 1).to_list(length=None)
+
             # Deserialize datetime objects
             deserialized_session = self._deserialize_datetime(session)
             return ChatSession(**deserialized_session)
@@ -254,7 +356,7 @@ class ChatService:
 
         # Step 1: Fetch the session and validate ownership
         sessions = await MongoDB.get_collection(self.sessions_collection)
-        session = await sessions.find_one({"id": session_id, "user_id": user_id})
+        session = await sessions.find_one({"id": session_id, "user_id": user_id}, {"_id": 1})
 
         if not session:
             raise HTTPException(
@@ -272,8 +374,15 @@ class ChatService:
             )
 
         # Step 3: Convert `table_data` to a Pandas DataFrame
-        table_data = df_message.table_data
-        if not table_data.get("records") or not table_data.get("columns"):
+        try:
+            table_data = await table_store.load(df_message.table_data)
+        except KeyError as e:
+            logging.error(str(e))
+            raise HTTPException(
+                status_code=404,
+                detail="Table data of this message is no longer available."
+            )
+        if not TableDataSerializer.row_count(table_data) or not table_data.get("columns"):
             logging.error(f"Invalid table_data structure: {table_data}")
             raise HTTPException(
                 status_code=400,
@@ -282,7 +391,7 @@ class ChatService:
 
         try:
             # Convert table_data to Pandas DataFrame
-            df = pd.DataFrame.from_records(table_data["records"], columns=table_data["columns"])
+            df = TableDataSerializer.to_dataframe(table_data)
             logging.debug(f"DataFrame created successfully with shape: {df.shape}")
         except Exception as e:
             logging.error(f"Error while converting table_data to DataFrame: {e}")
@@ -335,17 +444,7 @@ class ChatService:
 
 
         # Step 8: Save the assistant response to the session
-        assistant_msg_dict = self._serialize_datetime(assistant_msg.model_dump())
-        await sessions.update_one(
-            {"id": session_id},
-            {
-                "$push": {"messages": assistant_msg_dict},
-                "$set": {
-                    "last_message": assistant_msg.text,
-                    "timestamp": datetime.now(pytz.timezone("Asia/Kolkata"))
-                }
-            }
-        )
+        await self._append_messages(session_id, user_id, [self._message_doc(assistant_msg, user_id)], assistant_msg.text)
 
         return assistant_msg
 
@@ -357,19 +456,22 @@ class ChatService:
     async def get_user_sessions(self, user_id: str) -> List[ChatSession]:
         try:
             sessions = await MongoDB.get_collection(self.sessions_collection)
-            cursor = sessions.find({"user_id": user_id}).sort("timestamp", -1)
-
-            user_sessions = []
-            async for session in cursor:
-                # Filter messages with df_parent in the backend
-                session["messages"] = [
-                    message for message in session.get("messages", [])
-                    if not message.get("df_parent")
-                ]
-                deserialized_session = self._deserialize_datetime(session)
-                user_sessions.append(ChatSession(**deserialized_session))
-
-            return user_sessions
+            user_sessions = await sessions.find({"user_id": user_id}, {"_id": 0}).sort("timestamp", -1).to_list(length=None)
+
+            # One query for the messages of all sessions; DF answers stay out of the listing
+            messages = await MongoDB.get_collection(self.messages_collection)
+            session_messages = {session["id"]: [] for session in user_sessions}
+            cursor = messages.find(
+                {"user_id": user_id, "session_id": {"$in": list(session_messages)}, "df_parent": None},
+                {"_id": 0}
+            ).sort("timestamp", 1)
+            async for message in cursor:
+                session_messages[message["session_id"]].append(message)
+
+            return [
+                ChatSession(**self._deserialize_datetime({**session, "messages": session_messages[session["id"]]}))
+                for session in user_sessions
+            ]
 
         except Exception as e:
             logging.error(f"Failed to get user sessions: {str(e)}")
@@ -379,12 +481,56 @@ class ChatService:
             )
 
 
-    # backend/services/chat.py
+    @staticmethod
+    def _encode_cursor(session: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps([session["timestamp"], session["id"]]).encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> tuple:
+        try:
+            timestamp, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return str(timestamp), str(session_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+
+    async def list_user_sessions(self, user_id: str, limit: int = 50, cursor: Optional[str] = None):
+        """
+        Returns one page of session summaries, newest first, and the cursor of the next page
+        (None on the last page). Only the summary fields are read, through the
+        (user_id, timestamp, id) index.
+        """
+        query = {"user_id": user_id}
+        if cursor:
+            timestamp, session_id = self._decode_cursor(cursor)
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "id": {"$lt": session_id}},
+            ]
+
+        try:
+            sessions = await MongoDB.get_collection(self.sessions_collection)
+            projection = {"_id": 0, "id": 1, "title": 1, "persona": 1, "timestamp": 1, "last_message": 1}
+            page = await sessions.find(query, projection) \
+                .sort([("timestamp", -1), ("id", -1)]) \
+                .limit(limit + 1) \
+                .to_list(length=limit + 1)
+        except Exception as e:
+            logging.error(f"Failed to list user sessions: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to fetch chat sessions"
+            )
+
+        next_cursor = self._encode_cursor(page[limit - 1]) if len(page) > limit else None
+        return [ChatSessionSummary(**session) for session in page[:limit]], next_cursor
 
     async def get_session_messages(self, session_id: str, user_id: str) -> List[ChatMessage]:
         try:
             sessions = await MongoDB.get_collection(self.sessions_collection)
-            session = await sessions.find_one({"id": session_id, "user_id": user_id})
+            session = await sessions.find_one({"id": session_id, "user_id": user_id}, {"_id": 1})
 
             if not session:
                 raise HTTPException(
@@ -392,14 +538,12 @@ class ChatService:
                     detail="Chat session not found get session messages"
                 )
 
-            # Filter out DF-related messages
-            messages = [
-                message for message in session.get("messages", [])
-                if not message.get("df_parent")  # Exclude DF messages
-            ]
-
-            logging.debug(f"Filtered messages for session {session_id}: {messages}")
-            return [ChatMessage(**message) for message in messages]
+            # Exclude DF messages
+            messages = await MongoDB.get_collection(self.messages_collection)
+            cursor = messages.find({"session_id": session_id, "df_parent": None}, {"_id": 0}).sort("timestamp", 1)
+            return [ChatMessage(**message) async for message in cursor]
+        except HTTPException:
+            raise
         except Exception as e:
             logging.error(f"Failed to get session messages: {str(e)}")
             raise HTTPException(
@@ -426,6 +570,11 @@ class ChatService:
                     detail="Chat session not found delete session"
                 )
 
+            messages = await MongoDB.get_collection(self.messages_collection)
+            await messages.delete_many({"session_id": session_id})
+            getContext.history_buffer.forget(session_id)
+            await table_store.delete_session_tables(session_id)
+
         except HTTPException:
             raise
         except Exception as e:
@@ -1,16 +1,23 @@
 from typing import List, Optional, Dict, Any, Union
 from fastapi import HTTPException, status
-from backend.models.chat import ChatMessage, ChatResponse, ChatSession
+from backend.models.chat import ChatResponse, ChatSession
 from backend.database.mongodb import MongoDB
 from datetime import datetime
 from bson import ObjectId
 import logging
+import time
+from collections import OrderedDict, deque
+from backend.core.config import settings
 
 class GetContext:
      
     def __init__(self):
         self.sessions_collection = "chats"
         self.messages_collection = "chat_messages"
+        self.history_buffer = SessionHistoryBuffer(
+            capacity=settings.HISTORY_BUFFER_SIZE,
+            ttl=settings.HISTORY_BUFFER_TTL_SECONDS,
+        )
 
     def _serialize_datetime(self, obj: Any) -> Any:
         """Recursively convert datetime objects to ISO format strings"""
@@ -55,35 +62,28 @@ class GetContext:
                 detail="Failed to fetch chat sessions"
             )
 
-    async def get_session_context(self, session_id: str, user_id: str,n:int=6) -> str:
+    async def get_session_context(self, session_id: str, user_id: str,n:int=6, message_count: Optional[int] = None) -> str:
+        """
+        Context string of the last n messages. Pass the session's `message_count` when the
+        session document is at hand, so a buffer that missed turns is refetched.
+        """
         try:
-            sessions = await MongoDB.get_collection(self.sessions_collection)
-            session = await sessions.find_one({
-                "id": session_id,
-                "user_id": user_id
-            })
+            last_messages = self.history_buffer.tail(session_id, user_id, n, message_count)
+            if last_messages is None:
+                last_messages = await self.get_last_messages(session_id, user_id, n)
+                self.history_buffer.load(session_id, user_id, last_messages, complete=len(last_messages) < n, count=message_count)
 
-            if not session:
+            if not last_messages:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="Chat session not found session context"
                 )
 
-            # Deserialize datetime objects from the stored messages
-            deserialized_session = self._deserialize_datetime(session)
-
-            # Extract the messages and take the last 6
-            messages = deserialized_session.get("messages", [])
-            last_messages = messages[-n:]
-
-            # Convert to ChatMessage objects and build context_str
-            chat_messages = [ChatMessage(**msg) for msg in last_messages]
             context_str = "\n".join(
-                            f"{'User Question ' if i % 2 == 0 else 'Bot Response '}: {msg.text}"
-                            for i, msg in enumerate(chat_messages)
+                            f"{'User Question ' if msg.get('sender') == 'user' else 'Bot Response '}: {msg.get('text', '')}"
+                            for msg in last_messages
                         )
-           
-            
+
             return context_str
 
         except HTTPException:
@@ -94,5 +94,91 @@ class GetContext:
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to fetch session messages"
             )
-        
+
+    async def get_last_messages(self, session_id: str, user_id: str, n: int) -> List[dict]:
+        """
+        Oldest-first `{text, sender}` of the newest n messages of a session, served by the
+        (session_id, timestamp) index. Every session starts with a greeting, so an empty
+        list means the session does not exist or belongs to someone else.
+        """
+        messages = await MongoDB.get_collection(self.messages_collection)
+        cursor = messages.find(
+            {"session_id": session_id, "user_id": user_id},
+            {"_id": 0, "text": 1, "sender": 1}
+        ).sort("timestamp", -1).limit(n)
+        return (await cursor.to_list(length=n))[::-1]
+
+
+class SessionHistoryBuffer:
+    """
+    In-process ring buffer of the latest messages of recently active sessions, so the
+    context of consecutive turns is built without a database round trip.
+
+    ChatService records every message it saves here. With several uvicorn workers, a turn
+    served by another worker is not seen by this buffer, so each entry also counts the
+    messages of its session: a `tail` given the session's stored `message_count` refetches
+    when the counts differ. Entries also expire after `ttl` seconds.
+    """
+
+    def __init__(self, capacity: int = 20, max_sessions: int = 1000, ttl: float = 120):
+        self.capacity = capacity
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, dict]" = OrderedDict()
+
+    def _entry(self, session_id: str, user_id: str) -> Optional[dict]:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        if entry["expires"] < time.monotonic():
+            del self._sessions[session_id]
+            return None
+        if entry["user_id"] != user_id:
+            return None
+        self._sessions.move_to_end(session_id)
+        return entry
+
+    def tail(self, session_id: str, user_id: str, n: int, message_count: Optional[int] = None) -> Optional[List[dict]]:
+        """The last n messages, or None when the buffer cannot answer for sure"""
+        entry = self._entry(session_id, user_id)
+        if entry is None or n > self.capacity:
+            return None
+        if message_count is not None and entry["count"] != message_count:
+            # Another worker saved messages this buffer has not seen
+            self.forget(session_id)
+            return None
+        messages = entry["messages"]
+        if len(messages) < n and not entry["complete"]:
+            return None
+        return list(messages)[-n:]
+
+    def load(self, session_id: str, user_id: str, messages: List[dict], complete: bool, count: Optional[int] = None) -> None:
+        """
+        Start buffering a session from its newest messages; `complete` if that is its whole history.
+        `count` is the session's total number of messages (len(messages) when complete).
+        """
+        self._sessions[session_id] = {
+            "user_id": user_id,
+            "messages": deque(({"text": m.get("text"), "sender": m.get("sender")} for m in messages), maxlen=self.capacity),
+            "complete": complete,
+            "count": len(messages) if complete and count is None else count,
+            "expires": time.monotonic() + self.ttl,
+        }
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def append(self, session_id: str, user_id: str, messages: List[dict]) -> None:
+        entry = self._entry(session_id, user_id)
+        if entry is None:
+            return
+        entry["messages"].extend({"text": m.get("text"), "sender": m.get("sender")} for m in messages)
+        if entry["count"] is not None:
+            entry["count"] += len(messages)
+        entry["expires"] = time.monotonic() + self.ttl
+
+    def forget(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+
 getContext=GetContext()
\ No newline at end of file
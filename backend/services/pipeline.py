@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable
+
+
+class TurnPipeline:
+    """
+    A tiny DAG scheduler for one chat turn.
+
+    Stages are async callables registered with the names of the stages they depend on.
+    Each stage starts as soon as all of its dependencies have finished and receives their
+    results as keyword arguments, so independent stages overlap. Per-stage timings
+    (start offset and duration, in milliseconds) are recorded in `timings`.
+
+    Example:
+        pipeline = TurnPipeline()
+        pipeline.add("context", load_context)
+        pipeline.add("sql", run_sql, deps=["context"])
+        results = await pipeline.run()
+    """
+
+    def __init__(self, name: str = "turn"):
+        self.name = name
+        self._stages: Dict[str, tuple] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    def add(self, name: str, func: Callable[..., Awaitable[Any]], deps: Iterable[str] = ()) -> "TurnPipeline":
+        if name in self._stages:
+            raise ValueError(f"Stage '{name}' is already registered")
+        self._stages[name] = (func, tuple(deps))
+        return self
+
+    async def run(self) -> Dict[str, Any]:
+        for name, (_, deps) in self._stages.items():
+            missing = [dep for dep in deps if dep not in self._stages]
+            if missing:
+                raise ValueError(f"Stage '{name}' depends on unknown stages {missing}")
+
+        started = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(name: str):
+            func, deps = self._stages[name]
+            inputs = {dep: await tasks[dep] for dep in deps}
+            stage_start = time.perf_counter()
+            try:
+                return await func(**inputs)
+            finally:
+                self.timings[name] = {
+                    "start_ms": round((stage_start - started) * 1000, 1),
+                    "duration_ms": round((time.perf_counter() - stage_start) * 1000, 1),
+                }
+
+        # Tasks only await their dependencies, so creating them all up front is safe;
+        # a dependency cycle would simply never resolve, so reject it before starting.
+        self._check_acyclic()
+        for name in self._stages:
+            tasks[name] = asyncio.ensure_future(run_stage(name))
+
+        try:
+            results = await asyncio.gather(*tasks.values())
+        except Exception:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        finally:
+            total_ms = round((time.perf_counter() - started) * 1000, 1)
+            logging.info(f"{self.name} pipeline finished in {total_ms} ms, stage timings: {self.timings}")
+
+        return dict(zip(tasks.keys(), results))
+
+    def _check_acyclic(self):
+        visiting, done = set(), set()
+
+        def visit(name: str):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through stage '{name}'")
+            visiting.add(name)
+            for dep in self._stages[name][1]:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self._stages:
+            visit(name)
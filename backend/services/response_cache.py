@@ -0,0 +1,279 @@
+import os
+import re
+import time
+import uuid
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from diskcache import Cache
+
+from backend.core.config import settings
+from backend.sahdev.embeddings import get_embedding_service
+from backend.sahdev.embeddings.embedding_cache import normalize_text
+
+_number_re = re.compile(r"\d+(?:\.\d+)?")
+
+
+@dataclass(frozen=True)
+class ResponseCacheKey:
+    """
+    Everything a cached answer depends on: the normalized question, the persona, a hash of
+    the conversation context the question was resolved against, and the training data
+    generation. Only the question is matched by similarity; the rest must be equal.
+    """
+    question: str
+    persona: str
+    context_hash: str
+    generation: str
+
+    @classmethod
+    def build(cls, question: str, persona: Optional[str], context_str: Optional[str], generation: str) -> "ResponseCacheKey":
+        context_hash = hashlib.sha256(normalize_text(context_str or "").encode("utf-8")).hexdigest()[:16]
+        return cls(
+            question=normalize_text(question),
+            persona=persona or "",
+            context_hash=context_hash,
+            generation=generation,
+        )
+
+    @property
+    def scope(self) -> tuple:
+        return ("index", self.persona, self.generation, self.context_hash)
+
+
+class SemanticResponseCache:
+    """
+    Caches AI responses and finds them again by question similarity rather than exact text.
+
+    Entries live in an LRU, size-limited diskcache with a TTL, so every uvicorn worker
+    shares them. Each scope (persona + training data generation + conversation context)
+    keeps a small index of entry keys and their normalized question embeddings in a
+    separate metadata cache; a lookup is one matrix-vector product over that index.
+
+    Two questions only match when their cosine similarity reaches `threshold` *and* they
+    mention the same numbers, so "top 5 customers" never answers "top 10 customers".
+
+    Scopes of an older training generation that has not been stored under for `generation_grace`
+    seconds can never be hit again; they are dropped, with their entries, when a new
+    generation is first seen and on every `invalidate`.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        threshold: float = 0.95,
+        ttl: Optional[int] = 60 * 60 * 24,
+        size_limit: int = 2 ** 30,
+        max_entries_per_scope: int = 5000,
+        generation_grace: int = 600,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries_per_scope = max_entries_per_scope
+        # Workers memoize the generation for a while, so the previous one can still be in use briefly
+        self.generation_grace = generation_grace
+        self.entries = Cache(
+            os.path.join(directory, "responses"),
+            size_limit=size_limit,
+            eviction_policy="least-recently-used",
+        )
+        self.meta = Cache(os.path.join(directory, "responses_meta"), eviction_policy="none")
+        self.embedding_service = get_embedding_service()
+
+    @staticmethod
+    def _numbers(question: str) -> list:
+        return _number_re.findall(question)
+
+    def _embed(self, question: str) -> np.ndarray:
+        embedding = np.asarray(self.embedding_service.embed(question), dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def _load_index(self, scope: tuple):
+        index = self.meta.get(scope)
+        if not index:
+            return [], np.empty((0, 0), dtype=np.float32)
+        keys, vectors = index
+        return keys, np.frombuffer(vectors, dtype=np.float32).reshape(len(keys), -1)
+
+    def _save_index(self, scope: tuple, keys: list, matrix: np.ndarray):
+        if keys:
+            self.meta.set(scope, (keys, np.ascontiguousarray(matrix).tobytes()))
+        else:
+            self.meta.delete(scope)
+
+    def _remove_from_index(self, scope: tuple, entry_keys: set):
+        with self.meta.transact():
+            keys, matrix = self._load_index(scope)
+            keep = [position for position, key in enumerate(keys) if key not in entry_keys]
+            if len(keep) != len(keys):
+                self._save_index(scope, [keys[position] for position in keep], matrix[keep])
+
+    def _index_scopes(self) -> list:
+        return [scope for scope in self.meta.iterkeys() if isinstance(scope, tuple) and scope[0] == "index"]
+
+    def _note_generation(self, generation: str):
+        seen_key = ("generation_seen", generation)
+        first_seen = seen_key not in self.meta
+        self.meta.set(seen_key, time.time())
+        if first_seen:
+            self.prune_generations()
+
+    def prune_generations(self) -> int:
+        """
+        Drops the index scopes and entries of every training generation, except the latest,
+        not stored under for `generation_grace` seconds. Returns the number of entries removed.
+        """
+        seen = {
+            seen_key: self.meta.get(seen_key, 0) for seen_key in self.meta.iterkeys()
+            if isinstance(seen_key, tuple) and seen_key[0] == "generation_seen"
+        }
+        if not seen:
+            return 0
+        # The latest generation stays live however long ago it was last stored under
+        cutoff = min(time.time() - self.generation_grace, max(seen.values()))
+        live = set()
+        for seen_key, last_seen in seen.items():
+            if last_seen >= cutoff:
+                live.add(seen_key[1])
+            else:
+                self.meta.delete(seen_key)
+
+        removed = 0
+        for scope in self._index_scopes():
+            if scope[2] in live:
+                continue
+            keys, _ = self._load_index(scope)
+            removed += sum(1 for entry_key in keys if self.entries.delete(entry_key))
+            self.meta.delete(scope)
+        if removed:
+            logging.info(f"Dropped {removed} cached responses of old training generations")
+        return removed
+
+    def lookup(self, key: ResponseCacheKey) -> Optional[dict]:
+        """
+        Returns the cached response of the most similar earlier question in the same scope,
+        or None when nothing is close enough.
+        """
+        keys, matrix = self._load_index(key.scope)
+        if not keys:
+            self.meta.incr("stats:misses")
+            return None
+
+        similarities = matrix @ self._embed(key.question)
+        numbers = self._numbers(key.question)
+        for position in np.argsort(-similarities):
+            if similarities[position] < self.threshold:
+                break
+            entry = self.entries.get(keys[position])
+            if entry is None:
+                # Evicted or expired; drop it from the index
+                self._remove_from_index(key.scope, {keys[position]})
+                continue
+            if self._numbers(entry["question"]) != numbers:
+                continue
+            self.meta.incr("stats:hits")
+            logging.info(
+                f"Semantic cache hit ({similarities[position]:.3f}): '{key.question}' -> '{entry['question']}'"
+            )
+            return entry["response"]
+
+        self.meta.incr("stats:misses")
+        return None
+
+    def store(self, key: ResponseCacheKey, response: dict) -> str:
+        self._note_generation(key.generation)
+        embedding = self._embed(key.question)
+        entry_key = str(uuid.uuid4())
+
+        self.entries.set(
+            entry_key,
+            {
+                "question": key.question,
+                "persona": key.persona,
+                "context_hash": key.context_hash,
+                "generation": key.generation,
+                "created": time.time(),
+                "response": response,
+            },
+            expire=self.ttl,
+        )
+
+        with self.meta.transact():
+            keys, matrix = self._load_index(key.scope)
+            if keys:
+                matrix = np.vstack([matrix, embedding])
+            else:
+                matrix = embedding.reshape(1, -1)
+            keys = keys + [entry_key]
+            # Oldest entries fall out of the index first
+            self._save_index(key.scope, keys[-self.max_entries_per_scope:], matrix[-self.max_entries_per_scope:])
+
+        return entry_key
+
+    def invalidate(
+        self,
+        prefix: Optional[str] = None,
+        persona: Optional[str] = None,
+        generation: Optional[str] = None,
+    ) -> int:
+        """
+        Removes every entry matching all of the given filters: the normalized question starts
+        with `prefix`, the persona equals `persona`, the training generation equals `generation`.
+        With no filter at all the whole cache is cleared. Returns the number of entries removed.
+        """
+        if prefix is None and persona is None and generation is None:
+            removed = len(self.entries)
+            self.entries.clear()
+            for key in list(self.meta.iterkeys()):
+                if isinstance(key, tuple) and key[0] in ("index", "generation_seen"):
+                    self.meta.delete(key)
+            return removed
+
+        removed = self.prune_generations()
+        prefix = normalize_text(prefix) if prefix is not None else None
+        for scope in self._index_scopes():
+            _, scope_persona, scope_generation, _ = scope
+            if persona is not None and scope_persona != persona:
+                continue
+            if generation is not None and scope_generation != generation:
+                continue
+
+            keys, _ = self._load_index(scope)
+            doomed = set()
+            for entry_key in keys:
+                if prefix is not None:
+                    entry = self.entries.get(entry_key)
+                    if entry is not None and not entry["question"].startswith(prefix):
+                        continue
+                if self.entries.delete(entry_key):
+                    removed += 1
+                doomed.add(entry_key)
+            self._remove_from_index(scope, doomed)
+
+        logging.info(f"Invalidated {removed} cached responses (prefix={prefix}, persona={persona}, generation={generation})")
+        return removed
+
+    def stats(self) -> dict:
+        hits = self.meta.get("stats:hits", 0)
+        misses = self.meta.get("stats:misses", 0)
+        lookups = hits + misses
+        return {
+            "entries": len(self.entries),
+            "size_bytes": self.entries.volume(),
+            "size_limit": self.entries.size_limit,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+response_cache = SemanticResponseCache(
+    directory=settings.RESPONSE_CACHE_DIR,
+    threshold=settings.RESPONSE_CACHE_THRESHOLD,
+    ttl=settings.RESPONSE_CACHE_TTL_SECONDS,
+    size_limit=settings.RESPONSE_CACHE_SIZE_LIMIT,
+)
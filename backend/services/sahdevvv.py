@@ -7,7 +7,7 @@ import os
 import warnings
 from ..sahdev.openai import OpenAI_Chat
 # from ..sahdev.openai import OpenAI_Chat
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI
 #from sahdev.pgvector.pgvector import PG_VectorStore 
 #from backend.sahdev.pgvector.pgvector import PG_VectorStore
 from urllib3.exceptions import InsecureRequestWarning  # Import the specific warning
@@ -21,6 +21,13 @@ client = AzureOpenAI(
     azure_endpoint= os.getenv("AZURE_API_BASE")      
 )
 
+# Used by the *_async methods so the event loop can hold many LLM calls in flight
+async_client = AsyncAzureOpenAI(
+    api_key = os.getenv("AZURE_API_KEY"),
+    api_version=os.getenv("AZURE_API_VERSION"),
+    azure_endpoint= os.getenv("AZURE_API_BASE")
+)
+
 
 
 class MySahdev(PG_VectorStore, OpenAI_Chat):
@@ -33,11 +40,26 @@ class MySahdev(PG_VectorStore, OpenAI_Chat):
         PG_VectorStore.__init__(self, config={"connection_string": connection_string})
 
 
-        OpenAI_Chat.__init__(self, client=client, config=config) # Make sure to put your AzureOpenAI client here# Make sure to put your AzureOpenAI client here
+        OpenAI_Chat.__init__(self, client=client, config=config, async_client=async_client) # Make sure to put your AzureOpenAI client here# Make sure to put your AzureOpenAI client here
 
 sd = MySahdev(config={'model': 'gpt-4'})
 # Create a singleton instance
-sd = MySahdev()
+sd = MySahdev(config={
+    'max_result_rows': settings.MSSQL_MAX_ROWS,
+    'max_result_bytes': settings.MSSQL_MAX_BYTES,
+    'fetch_chunk_size': settings.MSSQL_FETCH_CHUNK_SIZE,
+    'schema_graph': settings.SCHEMA_GRAPH_ENABLED,
+    'schema_graph_max_columns': settings.SCHEMA_GRAPH_MAX_COLUMNS,
+    'sql_templates': settings.SQL_TEMPLATES_ENABLED,
+    'sql_validation': settings.SQL_VALIDATION_ENABLED,
+    'sql_validation_schema': settings.SQL_VALIDATION_SCHEMA,
+    'speculative_candidates': settings.SQL_SPECULATIVE_CANDIDATES,
+    'speculative_temperature': settings.SQL_SPECULATIVE_TEMPERATURE,
+    'query_cache_dir': settings.QUERY_CACHE_DIR if settings.QUERY_CACHE_ENABLED else None,
+    'query_cache_ttl': settings.QUERY_CACHE_TTL_SECONDS,
+    'query_cache_table_ttls': settings.query_cache_table_ttls,
+    'query_cache_size_limit': settings.QUERY_CACHE_SIZE_LIMIT,
+})
 #sd.connect_to_mssql(odbc_conn_str=os.getenv("MSSQL_URL"))
 sd.connect_to_mssql(odbc_conn_str=settings.MSSQL_URL)
 
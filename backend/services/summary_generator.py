@@ -87,13 +87,21 @@ class DataframeSummary:
         return tailored_prompt
     
 
-    def generate_summary(self, question: str) -> str:
+    def generate_summary_stream(self, question: str):
         """
-        Generate the summary using the LLM and tailored prompt.
+        Yield the summary text chunk by chunk, as the interpreter produces it.
         """
-        # Generate the prompt
         prompt = self.generate_tailored_prompt(question)
+        for chunk in interpreter.chat(prompt, stream=True, display=False):
+            if chunk.get('type') in['message'] and chunk.get('role') in ['assistant']:
+                content = chunk.get('content')
+                if content:  # Ensure content is not None or empty
+                    yield str(content)
 
+    def generate_summary(self, question: str) -> str:
+        """
+        Generate the summary using the LLM and tailored prompt.
+        """
         # Prepare messages for the LLM
         # messages = [
         #     {"role": "system", "content": "You are a helpful assistant."},
@@ -106,15 +114,7 @@ class DataframeSummary:
 
             # Call the interpreter with the messages
             # summary = interpreter.chat(messages, display=False)
-            ms=[]
-
-            for chunk in interpreter.chat(prompt, stream=True, display=False):
-    # Filter out chunks with 'html' or 'image' formats
-                #if chunk.get('format') not in ['html', 'image'] and chunk.get('role') in ['assistant'] and :
-                if chunk.get('type') in['message'] and chunk.get('role') in ['assistant']:
-                    content = chunk.get('content')
-                    if content:  # Ensure content is not None or empty
-                        ms.append(str(content))
+            ms = list(self.generate_summary_stream(question))
             
             # Join the collected content and print as a single message
             output_message = "".join(ms)
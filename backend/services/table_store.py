@@ -0,0 +1,160 @@
+import json
+import uuid
+import zlib
+import logging
+from datetime import datetime
+from typing import Optional
+
+import pytz
+from bson import Binary
+
+from backend.core.config import settings
+from backend.database.mongodb import MongoDB
+from backend.services.custom_json import TableDataSerializer
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _compress(payload: bytes) -> tuple:
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=3).compress(payload)
+    return "zlib", zlib.compress(payload, 6)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError(
+                "You need to install required dependencies to read this table,"
+                " run command: pip install zstandard"
+            )
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class TableStore:
+    """
+    Keeps query result tables out of the chat session documents.
+
+    A table is split into chunks of `chunk_rows` rows; each chunk holds the column arrays of
+    its rows as compressed JSON (zstd when `zstandard` is installed, zlib otherwise) in
+    `chat_table_chunks`, and one header document in `chat_tables` records the columns and
+    the row count. A page of rows only reads the chunks it overlaps.
+
+    The chat message keeps a small `table_data` stub instead: the first `preview_rows`
+    rows plus `table_ref`, `row_count` and `truncated`.
+    """
+
+    tables_collection = "chat_tables"
+    chunks_collection = "chat_table_chunks"
+
+    def __init__(self, chunk_rows: int = 1000, preview_rows: int = 50):
+        self.chunk_rows = chunk_rows
+        self.preview_rows = preview_rows
+
+    async def ensure_indexes(self) -> None:
+        tables = await MongoDB.get_collection(self.tables_collection)
+        chunks = await MongoDB.get_collection(self.chunks_collection)
+        await tables.create_index("table_id", unique=True)
+        await tables.create_index("session_id")
+        await chunks.create_index([("table_id", 1), ("seq", 1)], unique=True)
+
+    def needs_offload(self, table_data: Optional[dict]) -> bool:
+        return bool(table_data) and "table_ref" not in table_data and \
+            TableDataSerializer.row_count(table_data) > self.preview_rows
+
+    async def save(self, table_data: dict, session_id: str, user_id: str, message_id: str) -> dict:
+        """
+        Stores the rows of `table_data` and returns the stub to keep on the message.
+        """
+        table_id = str(uuid.uuid4())
+        row_count = TableDataSerializer.row_count(table_data)
+        columns = table_data["columns"]
+        values = TableDataSerializer.to_columns(table_data)
+
+        chunk_docs = []
+        for seq, offset in enumerate(range(0, row_count, self.chunk_rows)):
+            payload = json.dumps(
+                [column[offset:offset + self.chunk_rows] for column in values], default=str
+            ).encode("utf-8")
+            codec, data = _compress(payload)
+            chunk_docs.append({"table_id": table_id, "seq": seq, "codec": codec, "data": Binary(data)})
+
+        chunks = await MongoDB.get_collection(self.chunks_collection)
+        if chunk_docs:
+            await chunks.insert_many(chunk_docs, ordered=False)
+
+        tables = await MongoDB.get_collection(self.tables_collection)
+        await tables.insert_one({
+            "table_id": table_id,
+            "session_id": session_id,
+            "user_id": user_id,
+            "message_id": message_id,
+            "columns": columns,
+            "row_count": row_count,
+            "chunk_rows": self.chunk_rows,
+            "truncated": table_data.get("truncated", False),
+            "created": datetime.now(pytz.timezone("Asia/Kolkata")),
+        })
+
+        stub = TableDataSerializer.slice_rows(table_data, 0, self.preview_rows)
+        stub.update({"table_ref": table_id, "row_count": row_count, "truncated": table_data.get("truncated", False)})
+        return stub
+
+    async def load(self, table_data: dict, offset: int = 0, limit: Optional[int] = None) -> dict:
+        """
+        Returns rows [offset, offset + limit) of a message's table as table_data, in the
+        layout of the stub. Tables still embedded in the message are sliced in place.
+        """
+        row_count = table_data.get("row_count", TableDataSerializer.row_count(table_data))
+        limit = row_count if limit is None else limit
+        table_id = table_data.get("table_ref")
+        if not table_id:
+            page = TableDataSerializer.slice_rows(table_data, offset, limit)
+            page.update({"row_count": row_count, "truncated": table_data.get("truncated", False)})
+            return page
+
+        tables = await MongoDB.get_collection(self.tables_collection)
+        header = await tables.find_one({"table_id": table_id}, {"_id": 0, "columns": 1, "row_count": 1, "chunk_rows": 1, "truncated": 1})
+        if not header:
+            raise KeyError(f"Table {table_id} not found")
+
+        chunk_rows = header["chunk_rows"]
+        end = min(offset + limit, header["row_count"])
+        values = [[] for _ in header["columns"]]
+        if offset < end:
+            first_seq, last_seq = offset // chunk_rows, (end - 1) // chunk_rows
+            chunks = await MongoDB.get_collection(self.chunks_collection)
+            cursor = chunks.find(
+                {"table_id": table_id, "seq": {"$gte": first_seq, "$lte": last_seq}},
+                {"_id": 0, "seq": 1, "codec": 1, "data": 1},
+            ).sort("seq", 1)
+            async for chunk in cursor:
+                chunk_values = json.loads(_decompress(chunk["codec"], chunk["data"]))
+                chunk_start = chunk["seq"] * chunk_rows
+                lo, hi = max(offset - chunk_start, 0), end - chunk_start
+                for column, chunk_column in zip(values, chunk_values):
+                    column.extend(chunk_column[lo:hi])
+
+        page = TableDataSerializer.from_columns(header["columns"], values, table_data.get("format"))
+        page.update({"row_count": header["row_count"], "truncated": header.get("truncated", False)})
+        return page
+
+    async def delete_session_tables(self, session_id: str) -> None:
+        tables = await MongoDB.get_collection(self.tables_collection)
+        table_ids = [doc["table_id"] async for doc in tables.find({"session_id": session_id}, {"table_id": 1})]
+        if not table_ids:
+            return
+        chunks = await MongoDB.get_collection(self.chunks_collection)
+        await chunks.delete_many({"table_id": {"$in": table_ids}})
+        await tables.delete_many({"session_id": session_id})
+        logging.info(f"Deleted {len(table_ids)} stored tables of session {session_id}")
+
+
+table_store = TableStore(
+    chunk_rows=settings.TABLE_CHUNK_ROWS,
+    preview_rows=settings.TABLE_PREVIEW_ROWS,
+)
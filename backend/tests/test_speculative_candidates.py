@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("sqlglot")
+
+from backend.sahdev.base.base import SahdevBase
+from backend.sahdev.exceptions import ValidationError
+
+
+class CandidateSahdev(SahdevBase):
+    """SahdevBase whose LLM always answers with the same fixed candidates."""
+
+    def __init__(self, candidates, config=None):
+        super().__init__(config={"sql_validation_schema": False, "speculative_candidates": 3, **(config or {})})
+        self.candidates = candidates
+        self.ran = []
+
+    async def generate_sql_candidates_async(self, question, context_str, n, **kwargs):
+        return list(self.candidates)
+
+    def run_sql(self, sql, **kwargs):
+        self.ran.append(sql)
+        raise AssertionError("run_sql should not be reached")
+
+
+for _name in SahdevBase.__abstractmethods__:
+    if _name not in vars(CandidateSahdev):
+        setattr(CandidateSahdev, _name, lambda self, *args, **kwargs: None)
+CandidateSahdev.__abstractmethods__ = frozenset()
+
+
+def test_single_candidate_is_validated():
+    sd = CandidateSahdev(["DELETE FROM SalesOrders"])
+
+    sql, error = asyncio.run(sd._first_valid_candidate_async("remove all orders", ""))
+
+    assert sql == "DELETE FROM SalesOrders"
+    assert isinstance(error, ValidationError)
+
+
+def test_first_passing_candidate_is_returned():
+    sd = CandidateSahdev(["DROP TABLE SalesOrders", "SELECT OrderId FROM SalesOrders"])
+
+    sql, error = asyncio.run(sd._first_valid_candidate_async("list the orders", ""))
+
+    assert sql == "SELECT OrderId FROM SalesOrders"
+    assert error is None
+
+
+def test_rejected_single_candidate_is_not_run():
+    sd = CandidateSahdev(["DELETE FROM SalesOrders"])
+    sd.generate_fallback_response_async = lambda *args, **kwargs: asyncio.sleep(0, result="fallback")
+    sd.generate_sql_async = lambda *args, **kwargs: asyncio.sleep(0, result="DELETE FROM SalesOrders")
+
+    sql, df, response = asyncio.run(sd.execute_query_with_retries_async("remove all orders", "", max_retries=2))
+
+    assert sd.ran == []
+    assert df is None
+    assert response == "fallback"
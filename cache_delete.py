@@ -1,7 +1,11 @@
-from diskcache import Cache
- 
- 
-cache_dir = "./cache_directory"
-cache = Cache(cache_dir)
- 
-cache.delete('Which sales orders have experienced OTIF (On-Time, In-Full) failures and are impacted the most?')
\ No newline at end of file
+import sys
+
+from backend.services.response_cache import response_cache
+
+
+# Usage: python cache_delete.py "<question prefix>" [persona]
+prefix = sys.argv[1] if len(sys.argv) > 1 else 'Which sales orders have experienced OTIF (On-Time, In-Full) failures and are impacted the most?'
+persona = sys.argv[2] if len(sys.argv) > 2 else None
+
+removed = response_cache.invalidate(prefix=prefix, persona=persona)
+print(f"Removed {removed} cached responses")